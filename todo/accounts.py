@@ -0,0 +1,90 @@
+"""
+Deleting accounts without one huge cascade.
+
+Deleting a user makes Django's collector load every one of their todos and
+delete them all in one transaction. Instead, ``schedule_deletion``
+deactivates the user, which logs them out everywhere, and queues an
+``AccountDeletion``; ``manage.py purgeaccounts`` then deletes their rows a
+batch per short transaction and the user row last, when the cascade has
+next to nothing left to collect. An interrupted purge resumes where it
+stopped.
+
+The cascade never reaches the user's todos, archive, counters, stats or
+changes, which may live on another shard: however a user is deleted (the
+admin, ``user.delete()``, ...), ``purge_user_data`` clears them on the
+user's shard first.
+"""
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import AccountDeletion, ArchivedToDo, DailyStats, ToDo, ToDoChange, TodoCounters
+from .sharding import on_user_shard
+
+# Everything on the user's shard (see todo.sharding), which the cascade
+# from the user row may not reach.
+PURGED_MODELS = (ToDo, ArchivedToDo, DailyStats, TodoCounters, ToDoChange)
+
+
+def schedule_deletion(user):
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        AccountDeletion.objects.get_or_create(user=user)
+
+
+def purge_batch(model, user_id, batch_size):
+    """
+    Deletes up to ``batch_size`` of the user's ``model`` rows and returns
+    how many went.
+    """
+    with transaction.atomic(using=router.db_for_write(model)):
+        ids = list(model.objects.filter(user_id=user_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if ids:
+            # The user's counters and stats go with them: no signals.
+            rows = model.objects.filter(pk__in=ids)
+            rows._raw_delete(rows.db)
+    return len(ids)
+
+
+def purge_data(user_id, batch_size=1000, progress=None):
+    """
+    Deletes the user's data on their shard, ``batch_size`` rows at a time,
+    and returns how many rows went.
+    """
+    deleted = 0
+    with on_user_shard(user_id):
+        for model in PURGED_MODELS:
+            while moved := purge_batch(model, user_id, batch_size):
+                deleted += moved
+                if progress:
+                    progress(user_id, deleted)
+    return deleted
+
+
+@receiver(pre_delete, sender=User)
+def purge_user_data(sender, instance, **kwargs):
+    purge_data(instance.pk)
+
+
+def purge_account(user_id, batch_size=1000, progress=None):
+    """
+    Deletes the user and all their data, ``batch_size`` rows at a time, and
+    returns how many rows were deleted before the user.
+    """
+    deleted = purge_data(user_id, batch_size, progress)
+    User.objects.filter(pk=user_id).delete()
+    return deleted
+
+
+def purge_accounts(batch_size=1000, progress=None):
+    """
+    Purges every account queued for deletion and returns how many there
+    were. Users reactivated since they were queued are left alone.
+    """
+    pending = AccountDeletion.objects.filter(user__is_active=False).order_by('requested_at')
+    user_ids = list(pending.values_list('user_id', flat=True))
+    for user_id in user_ids:
+        purge_account(user_id, batch_size, progress)
+    return len(user_ids)
@@ -0,0 +1,41 @@
+"""
+Responses for the complete, uncomplete and delete actions.
+
+Browsers get redirected back to the list. Scripts that ask for
+``application/json`` (see todo/js/todo-actions.js) get just what changed
+and the user's new counts, so the page updates in place instead of
+re-rendering the list and its pagination.
+"""
+from django.http import JsonResponse
+from django.shortcuts import redirect
+
+from .counters import aget_counters, get_counters
+
+
+def wants_json(request):
+    return request.get_preferred_type(['text/html', 'application/json']) == 'application/json'
+
+
+def counts(counters):
+    return {
+        'open': counters.open_count,
+        'completed': counters.completed_count,
+        'overdue': counters.overdue_count,
+    }
+
+
+def action_response(request, todo_pk, **change):
+    """
+    ``change`` is what happened to the todo: ``done=True/False`` or
+    ``deleted=True``; ``repeats=True`` on completion means its next
+    occurrence was just created (see todo.recurrence).
+    """
+    if not wants_json(request):
+        return redirect('currenttodos')
+    return JsonResponse({'id': todo_pk, **change, 'counts': counts(get_counters(request.user))})
+
+
+async def aaction_response(request, todo_pk, **change):
+    if not wants_json(request):
+        return redirect('currenttodos')
+    return JsonResponse({'id': todo_pk, **change, 'counts': counts(await aget_counters(request.user))})
@@ -1,7 +1,161 @@
-from django.contrib import admin
-from .models import ToDo
+import json
+from datetime import timedelta
 
-class ToDoAdmin(admin.ModelAdmin):
-    readonly_fields = ('creation_date', )
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import AccountDeletion, ArchivedToDo, ToDo
+from .sharding import sharded
+
+# Below this many rows (by the planner's estimate) counting exactly is cheap.
+EXACT_COUNT_BELOW = 10000
+
+
+def estimated_count(queryset):
+    """
+    The query planner's row estimate for ``queryset`` on PostgreSQL, or
+    None on databases without a cheap one.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return plan[0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts large changelists from the planner's estimate instead of a
+    COUNT(*) over millions of rows; page links past the real end come up
+    empty.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < EXACT_COUNT_BELOW:
+            return super().count
+        return estimate
+
+
+class DeadlineFilter(admin.SimpleListFilter):
+    title = 'deadline'
+    parameter_name = 'deadline'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('overdue', 'Overdue'),
+            ('today', 'Due today'),
+            ('week', 'Due in the next 7 days'),
+            ('none', 'No deadline'),
+        )
+
+    def queryset(self, request, queryset):
+        # Every choice is about open todos, so todo_done_deadline_idx serves it.
+        now = timezone.now()
+        today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.value() == 'overdue':
+            return queryset.filter(done=False, deadline_datetime__lt=now)
+        if self.value() == 'today':
+            return queryset.filter(done=False, deadline_datetime__gte=today, deadline_datetime__lt=today + timedelta(days=1))
+        if self.value() == 'week':
+            return queryset.filter(done=False, deadline_datetime__gte=now, deadline_datetime__lt=now + timedelta(days=7))
+        if self.value() == 'none':
+            return queryset.filter(done=False, deadline_datetime__isnull=True)
+        return queryset
+
+
+class ShardFilter(admin.SimpleListFilter):
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.TODO_SHARDS] if sharded() else []
+
+    def queryset(self, request, queryset):
+        # ShardedAdmin.get_queryset() already reads from the chosen shard.
+        return queryset
+
+
+class ShardedAdmin(admin.ModelAdmin):
+    """
+    Admin for a model stored per user shard (see todo.sharding): its pages
+    work on the shard picked in the "shard" filter, the default database
+    until one is. The change pages get it from the preserved filters.
+    """
+
+    def get_shard(self, request):
+        shard = request.GET.get('shard') or QueryDict(request.GET.get('_changelist_filters', '')).get('shard')
+        return shard if shard in settings.TODO_SHARDS else settings.TODO_SHARDS[0]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).using(self.get_shard(request))
+        # Users live on the default database, out of reach of a join.
+        return queryset.prefetch_related('user') if sharded() else queryset
+
+    def get_list_select_related(self, request):
+        # Not False, which makes the changelist join the user anyway.
+        return () if sharded() else super().get_list_select_related(request)
+
+    def get_list_filter(self, request):
+        return (*super().get_list_filter(request), ShardFilter)
+
+
+class ToDoAdmin(ShardedAdmin):
+    list_display = ('title', 'user', 'done', 'important', 'deadline_datetime', 'creation_date')
+    list_select_related = ('user',)
+    list_filter = ('done', 'important', DeadlineFilter)
+    raw_id_fields = ('user',)
+    readonly_fields = ('creation_date', 'updated_at', 'completed_at')
+    paginator = EstimatedCountPaginator
+    # Skips the unfiltered COUNT(*) next to filtered result counts.
+    show_full_result_count = False
+    actions = ('mark_done', 'mark_not_done', 'mark_important', 'delete_todos')
+
+    def get_actions(self, request):
+        # The stock action deletes one object at a time, after collecting
+        # them all for its confirmation page.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def run_update(self, request, queryset, **fields):
+        updated = queryset.update_tracked(**fields)
+        self.message_user(request, f'Updated {updated} todo(s).', messages.SUCCESS)
+
+    @admin.action(description='Mark selected todos as done', permissions=['change'])
+    def mark_done(self, request, queryset):
+        self.run_update(request, queryset, done=True)
+
+    @admin.action(description='Mark selected todos as not done', permissions=['change'])
+    def mark_not_done(self, request, queryset):
+        self.run_update(request, queryset, done=False)
+
+    @admin.action(description='Mark selected todos as important', permissions=['change'])
+    def mark_important(self, request, queryset):
+        self.run_update(request, queryset, important=True)
+
+    @admin.action(description='Delete selected todos', permissions=['delete'])
+    def delete_todos(self, request, queryset):
+        deleted = queryset.delete_tracked()
+        self.message_user(request, f'Deleted {deleted} todo(s).', messages.SUCCESS)
 
 admin.site.register(ToDo, ToDoAdmin)
+
+
+class ArchivedToDoAdmin(ShardedAdmin):
+    list_display = ('title', 'user', 'archived_at')
+    raw_id_fields = ('user',)
+
+admin.site.register(ArchivedToDo, ArchivedToDoAdmin)
+
+
+class AccountDeletionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'requested_at')
+    raw_id_fields = ('user',)
+
+admin.site.register(AccountDeletion, AccountDeletionAdmin)
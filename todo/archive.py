@@ -0,0 +1,68 @@
+"""
+Moving old completed todos out of the hot ``todo_todo`` table.
+
+Each batch copies rows into ``ArchivedToDo`` and deletes them from the hot
+table in one transaction, so an interrupted run loses nothing and the next
+one carries on where it stopped. Archiving doesn't change any user's
+counters (archived todos still count as completed), so it bypasses
+``todos_changed`` and only invalidates the affected users' cached lists.
+"""
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .cache import bump_versions
+from .models import ArchivedToDo, ToDo, TodoCounters
+from .sharding import each_shard
+
+ARCHIVED_FIELDS = (
+    'id', 'title', 'description', 'important', 'creation_date', 'updated_at', 'completed_at', 'deadline_datetime',
+    'user_id',
+)
+
+
+def archivable_todos(cutoff):
+    return ToDo.objects.filter(done=True, updated_at__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Archives up to ``batch_size`` todos completed before ``cutoff`` and
+    returns how many were moved.
+    """
+    now = timezone.now()
+    using = router.db_for_write(ToDo)
+    with transaction.atomic(using=using):
+        # Oldest first, straight off the todo_done_updated_idx partial index.
+        todos = archivable_todos(cutoff).order_by('updated_at', 'id')
+        if connections[todos.db].features.has_select_for_update_skip_locked:
+            todos = todos.select_for_update(skip_locked=True)
+        rows = list(todos.values_list(*ARCHIVED_FIELDS)[:batch_size])
+        if not rows:
+            return 0
+
+        ArchivedToDo.objects.bulk_create(
+            [ArchivedToDo(**dict(zip(ARCHIVED_FIELDS, row)), archived_at=now) for row in rows],
+            ignore_conflicts=True,
+        )
+        ToDo.objects.filter(id__in=[row[0] for row in rows])._raw_delete(todos.db)
+
+        # Rows change places in the completed list: hot rows come first.
+        user_ids = {row[-1] for row in rows}
+        TodoCounters.objects.filter(user_id__in=user_ids).update(last_modified=now)
+        transaction.on_commit(lambda: bump_versions(user_ids), using=using)
+    return len(rows)
+
+
+def archive_todos(older_than, batch_size=1000, progress=None):
+    """
+    Archives every todo completed more than ``older_than`` (a timedelta)
+    ago, ``batch_size`` at a time, and returns how many were moved.
+    """
+    cutoff = timezone.now() - older_than
+    archived = 0
+    for _ in each_shard():
+        while moved := archive_batch(cutoff, batch_size):
+            archived += moved
+            if progress:
+                progress(archived)
+    return archived
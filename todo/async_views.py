@@ -0,0 +1,125 @@
+"""
+Native async versions of the list, detail and complete/delete views.
+
+They are wired in instead of their todo.views counterparts when
+``TODO_ASYNC_VIEWS`` is on, so under ASGI a request for them never takes up
+a worker thread while it waits on the database or a slow client.
+"""
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import aget_object_or_404, render, redirect
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .actions import aaction_response
+from .cache import acached_fragment
+from .conditional import list_validators, not_modified, todo_validators, with_validators
+from .counters import aget_counters
+from .forms import TodoForm
+from .models import ArchivedToDo, ToDo
+from .pagination import apaginate_todos
+
+
+async def resolve_user(request):
+    # Templates read request.user synchronously, so load it up front.
+    request.user = await request.auser()
+    return request.user
+
+
+async def render_todo_list(request, name, done):
+    user = await resolve_user(request)
+    counters = await aget_counters(user)
+    etag, last_modified = list_validators(request, name, counters)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    async def render_fragment():
+        count = counters.completed_count if done else counters.open_count
+        todos = await apaginate_todos(
+            ToDo.objects.filter(user=user, done=done), request, count,
+            archive=ArchivedToDo.objects.filter(user=user) if done else None,
+        )
+        html = render_to_string(f'todo/{name}_list.html', {'todos': todos}, request)
+        return str(html), not todos
+
+    # Keyed on the counters read with the rows as well as the version: a
+    # lagging replica's page is cached under its own, older, last_modified.
+    variant = f'{settings.TODO_PAGINATION}:{last_modified.timestamp()}?{request.GET.urlencode()}'
+    html, empty = await acached_fragment(user.pk, name, variant, render_fragment)
+
+    response = render(request, f'todo/{name}.html', {'todos_html': mark_safe(html), 'todos_empty': empty})
+    return with_validators(request, response, etag, last_modified)
+
+
+@login_required
+async def currenttodos(request):
+    return await render_todo_list(request, 'currenttodos', done=False)
+
+
+@login_required
+async def completedtodos(request):
+    return await render_todo_list(request, 'completedtodos', done=True)
+
+
+@login_required
+async def viewtodo(request, todo_pk):
+    user = await resolve_user(request)
+    todo_task = await aget_object_or_404(ToDo, pk=todo_pk, user=user)
+
+    next_page = request.GET.get("next", "currenttodos")
+
+    if request.method == 'GET':
+        etag, last_modified = todo_validators(request, todo_task)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        form = TodoForm(instance=todo_task)
+        response = render(request, 'todo/viewtodo.html', {
+            'todo_task': todo_task,
+            'form': form,
+            'next_page': next_page,
+        })
+        return with_validators(request, response, etag, last_modified)
+
+    form = TodoForm(request.POST, instance=todo_task)
+
+    next_page = request.POST.get("next", "currenttodos")
+
+    if form.is_valid():
+        await form.save(commit=False).asave()
+
+        return redirect(next_page)
+
+    first_error = None
+    for errors in form.errors.values():
+        if errors:
+            first_error = errors[0]
+            break
+
+    return render(request, 'todo/viewtodo.html', {
+        'todo_task': todo_task,
+        'form': form,
+        'error': first_error,
+        'next_page': next_page
+    })
+
+
+@login_required
+async def completetodo(request, todo_pk):
+    todo = await aget_object_or_404(ToDo, pk=todo_pk, user=await resolve_user(request))
+    if request.method == 'POST':
+        todo.done = True
+        await todo.asave()
+
+        return await aaction_response(request, todo.pk, done=True, **({'repeats': True} if todo.recurrence else {}))
+
+
+@login_required
+async def deletetodo(request, todo_pk):
+    todo = await aget_object_or_404(ToDo, pk=todo_pk, user=await resolve_user(request))
+    if request.method == 'POST':
+        await todo.adelete()
+
+        return await aaction_response(request, todo_pk, deleted=True)
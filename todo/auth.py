@@ -0,0 +1,53 @@
+"""
+A model backend that serves the logged-in user from the cache.
+
+Saving a user writes the fresh instance through to the cache (which covers
+login's last_login update, password changes and admin edits) and deleting
+one drops it. Queryset ``update()`` calls bypass those signals, so cached
+users also expire after ``TODO_USER_CACHE_TIMEOUT`` seconds.
+"""
+import copy
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import get_cache
+
+USER_KEY = 'todo:user:{user_id}'
+# Permission caches ModelBackend leaves on the instance; they belong to one request.
+PERMISSION_CACHES = ('_perm_cache', '_user_perm_cache', '_group_perm_cache')
+
+
+def cache_user(user):
+    user = copy.copy(user)
+    for attribute in PERMISSION_CACHES:
+        user.__dict__.pop(attribute, None)
+    get_cache().set(USER_KEY.format(user_id=user.pk), user, timeout=settings.TODO_USER_CACHE_TIMEOUT)
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = USER_KEY.format(user_id=user_id)
+        user = get_cache().get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache_user(user)
+            return user
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=User)
+def write_through_user(sender, instance, **kwargs):
+    if instance.get_deferred_fields():
+        get_cache().delete(USER_KEY.format(user_id=instance.pk))
+    else:
+        cache_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, **kwargs):
+    get_cache().delete(USER_KEY.format(user_id=instance.pk))
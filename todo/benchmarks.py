@@ -0,0 +1,337 @@
+import asyncio
+import functools
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F
+from django.db.utils import load_backend
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, get_resolver, reverse
+
+from .cache import bump_versions
+from .models import ToDo, ToDoChange
+from .pagination import Cursor, keyset_order
+from .sync import SETTLE_SECONDS, SYNC_MAX_BATCH_SIZE
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+    }
+
+
+def urlconf(view_module):
+    from todo_project.urls import build_urlpatterns
+
+    # A class rather than a module object, but just as usable as ROOT_URLCONF.
+    return type('URLConf', (), {'urlpatterns': build_urlpatterns(view_module)})
+
+
+def logged_in_cookies(user):
+    client = Client()
+    client.force_login(user)
+    return client.cookies
+
+
+def run_wsgi(path, cookies, requests, concurrency):
+    def fetch(_):
+        client = Client()
+        client.cookies = cookies
+        started = time.perf_counter()
+        client.get(path)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(fetch, range(requests)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def run_asgi(path, cookies, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch():
+        async with semaphore:
+            client = AsyncClient()
+            client.cookies = cookies
+            started = time.perf_counter()
+            await client.get(path)
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(fetch() for _ in range(requests)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def compare_wsgi_asgi(user, path, requests=200, concurrency=20):
+    """
+    Serves ``path`` ``requests`` times, ``concurrency`` at a time, through the
+    WSGI handler with the sync views and through the ASGI handler with the
+    async views, and returns the summary of each run.
+
+    Django's async ORM still runs queries in one thread-sensitive executor,
+    so the ASGI path doesn't run queries in parallel; what it saves is a
+    thread per in-flight request, which matters with many slow clients
+    rather than in this in-process run.
+    """
+    from todo import async_views, views
+
+    cookies = logged_in_cookies(user)
+    results = {}
+
+    with override_settings(ROOT_URLCONF=urlconf(views)):
+        results['wsgi'] = run_wsgi(path, cookies, requests, concurrency)
+    with override_settings(ROOT_URLCONF=urlconf(async_views)):
+        results['asgi'] = asyncio.run(run_asgi(path, cookies, requests, concurrency))
+
+    return results
+
+
+class Scenario:
+    """
+    One request to benchmark: the view ``url_name`` called with ``method``
+    and the largest number of SQL queries it may run (``budget``).
+
+    ``prepare(client, user)`` runs before each request, outside the
+    measurement, and may return a dict with the ``args`` to reverse the URL
+    with, the request ``data``, a ``query`` string and extra ``headers``.
+    """
+
+    def __init__(self, url_name, budget, method='get', prepare=None, anonymous=False, label=None):
+        self.url_name = url_name
+        self.budget = budget
+        self.method = method
+        self.prepare = prepare
+        self.anonymous = anonymous
+        self.label = label or (url_name if method == 'get' else f'{url_name} {method.upper()}')
+
+    def request(self, client, user):
+        options = self.prepare(client, user) if self.prepare else {}
+        path = reverse(self.url_name, args=options.get('args', ())) + options.get('query', '')
+        send = getattr(client, self.method)
+        return functools.partial(send, headers=options.get('headers')), path, options.get('data', {})
+
+
+def some_todo(client, user):
+    return {'args': [ToDo.objects.filter(user=user).values_list('pk', flat=True).first()]}
+
+
+def new_todo(client, user):
+    return {'args': [ToDo.objects.create(user=user, title='Benchmark task').pk]}
+
+
+def new_todo_json(client, user):
+    return {**new_todo(client, user), 'headers': {'Accept': 'application/json'}}
+
+
+def edit_todo(client, user):
+    return {**some_todo(client, user), 'data': {'title': 'Edited benchmark task', 'next': 'currenttodos'}}
+
+
+def new_todos(client, user):
+    ids = [todo.pk for todo in ToDo.objects.create_tracked([ToDo(user=user, title='Benchmark task') for _ in range(20)])]
+    return {'data': {'action': 'delete', 'ids': ids}}
+
+
+def cold_cache(client, user):
+    bump_versions([user.pk])
+    return {}
+
+
+def deep_page(client, user):
+    # Keyset pages cost the same at any depth; offset pages are jumped to directly.
+    bump_versions([user.pk])
+    if settings.TODO_PAGINATION == 'offset':
+        return {'query': '?page=1000000'}
+    todos = keyset_order(ToDo.objects.filter(user=user, done=False))
+    count = todos.count()
+    if count < 2:
+        return {}
+    return {'query': '?after=' + Cursor.for_row(todos[count - 2], 2).encode()}
+
+
+def revalidate(url_name, prepare=None):
+    def prepare_revalidation(client, user):
+        options = prepare(client, user) if prepare else {}
+        response = client.get(reverse(url_name, args=options.get('args', ())))
+        return {**options, 'headers': {'If-None-Match': response['ETag']}}
+    return prepare_revalidation
+
+
+def synced(client, user):
+    # Cursors only move past settled changes; pretend the user's have.
+    ToDoChange.objects.filter(user=user).update(changed_at=F('changed_at') - timedelta(seconds=SETTLE_SECONDS))
+    cursor = client.get(reverse('synctodos'), {'limit': SYNC_MAX_BATCH_SIZE}).json()['cursor']
+    while True:
+        batch = client.get(reverse('synctodos'), {'cursor': cursor, 'limit': SYNC_MAX_BATCH_SIZE}).json()
+        if batch['cursor'] == cursor:
+            return {'query': f'?cursor={cursor}'}
+        cursor = batch['cursor']
+
+
+def logged_in(client, user):
+    client.force_login(user)
+    return {}
+
+
+def metrics_access(client, user):
+    # Scrapers send the token; without one configured, only staff get in.
+    if settings.TODO_METRICS_TOKEN:
+        return {'headers': {'Authorization': f'Bearer {settings.TODO_METRICS_TOKEN}'}}
+    if settings.SESSION_COOKIE_NAME not in client.cookies:
+        staff, _ = User.objects.get_or_create(username='benchmark-staff', defaults={'is_staff': True})
+        client.force_login(staff)
+    return {}
+
+
+def import_file(client, user):
+    upload = SimpleUploadedFile('todos.csv', b'title,important\nImported benchmark task,true\n')
+    return {'data': {'file': upload, 'format': 'csv'}}
+
+
+SCENARIOS = [
+    Scenario('home', 2),
+    Scenario('metrics', 2, prepare=metrics_access, anonymous=True),
+    Scenario('signupuser', 0, anonymous=True),
+    Scenario('loginuser', 0, anonymous=True),
+    Scenario('logoutuser', 4, method='post', prepare=logged_in),
+    Scenario('deleteaccount', 2),
+    Scenario('createtodo', 2),
+    Scenario('createtodo', 6, method='post', prepare=lambda client, user: {'data': {'title': 'Benchmark task'}}),
+    Scenario('currenttodos', 3),
+    Scenario('currenttodos', 5, prepare=cold_cache, label='currenttodos (cold cache)'),
+    Scenario('currenttodos', 5, prepare=deep_page, label='currenttodos (deep page)'),
+    Scenario('currenttodos', 3, prepare=revalidate('currenttodos'), label='currenttodos (not modified)'),
+    Scenario('completedtodos', 3),
+    Scenario('completedtodos', 5, prepare=cold_cache, label='completedtodos (cold cache)'),
+    Scenario('statstodos', 4),
+    Scenario('searchtodos', 3, prepare=lambda client, user: {'query': '?q=call'}),
+    Scenario('bulktodos', 10, method='post', prepare=new_todos),
+    Scenario('exporttodos', 4),
+    Scenario('importtodos', 2),
+    Scenario('importtodos', 8, method='post', prepare=import_file),
+    Scenario('synctodos', 4),
+    Scenario('synctodos', 3, prepare=synced, label='synctodos (up to date)'),
+    Scenario('viewtodo', 3, prepare=some_todo),
+    Scenario('viewtodo', 3, prepare=revalidate('viewtodo', some_todo), label='viewtodo (not modified)'),
+    Scenario('viewtodo', 7, method='post', prepare=edit_todo),
+    Scenario('completetodo', 8, method='post', prepare=new_todo),
+    Scenario('deletetodo', 10, method='post', prepare=new_todo),
+    Scenario('uncompletetodo', 7, method='post', prepare=new_todo),
+    Scenario('completetodo', 9, method='post', prepare=new_todo_json, label='completetodo POST (json)'),
+    Scenario('deletetodo', 11, method='post', prepare=new_todo_json, label='deletetodo POST (json)'),
+]
+
+
+class BenchmarkResult:
+    def __init__(self, scenario, latencies, queries, errors):
+        self.scenario = scenario
+        self.latencies = sorted(latencies)
+        self.queries = queries
+        self.errors = errors
+
+    @property
+    def p50_ms(self):
+        return statistics.median(self.latencies) * 1000
+
+    @property
+    def p95_ms(self):
+        return self.latencies[max(int(len(self.latencies) * 0.95) - 1, 0)] * 1000
+
+    @property
+    def over_budget(self):
+        return self.queries > self.scenario.budget
+
+    @property
+    def ok(self):
+        return not self.over_budget and not self.errors
+
+
+def run_scenario(scenario, user, repeat=20):
+    client = Client()
+    if not scenario.anonymous:
+        client.force_login(user)
+
+    # Warm up first: one-off work (building counters rows, ...) isn't what's measured.
+    send, path, data = scenario.request(client, user)
+    send(path, data)
+
+    latencies, queries, errors = [], 0, []
+    for _ in range(repeat):
+        send, path, data = scenario.request(client, user)
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as captured:
+            started = time.perf_counter()
+            response = send(path, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latencies.append(time.perf_counter() - started)
+        queries = max(queries, len(captured))
+        if response.status_code >= 400:
+            errors.append(f'{path} returned {response.status_code}')
+    return BenchmarkResult(scenario, latencies, queries, errors)
+
+
+def run_view_benchmarks(user, repeat=20, scenarios=SCENARIOS):
+    return [run_scenario(scenario, user, repeat) for scenario in scenarios]
+
+
+def unbenchmarked_url_names(scenarios=SCENARIOS):
+    """
+    Names of routed views (admin aside) that no scenario covers.
+    """
+    names = {pattern.name for pattern in get_resolver().url_patterns if isinstance(pattern, URLPattern)}
+    return names - {scenario.url_name for scenario in scenarios}
+
+
+def run_connections(settings_dict, alias, requests, concurrency):
+    """
+    Serves ``requests`` "requests" of one query each, ``concurrency`` at a
+    time, closing the connection after each like Django does at the end of
+    a request with CONN_MAX_AGE = 0 (or a pool); returns the summary.
+    """
+    backend = load_backend(settings_dict['ENGINE'])
+
+    def fetch(_):
+        connection = backend.DatabaseWrapper(settings_dict, alias)
+        started = time.perf_counter()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        finally:
+            connection.close()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(fetch, range(requests)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def compare_pooling(requests=500, concurrency=20, pool_options=None):
+    """
+    Runs the same concurrent load with a fresh connection per request and
+    with a psycopg pool, and returns the summary of each run.
+    """
+    base = {**connections.settings[DEFAULT_DB_ALIAS], 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True}
+    options = {key: value for key, value in base.get('OPTIONS', {}).items() if key != 'pool'}
+    pool_options = pool_options or base.get('OPTIONS', {}).get('pool') or {'min_size': concurrency, 'max_size': concurrency}
+
+    results = {'unpooled': run_connections({**base, 'OPTIONS': options}, 'bench_unpooled', requests, concurrency)}
+    pooled = {**base, 'OPTIONS': {**options, 'pool': pool_options}}
+    try:
+        results['pooled'] = run_connections(pooled, 'bench_pooled', requests, concurrency)
+    finally:
+        backend = load_backend(pooled['ENGINE'])
+        backend.DatabaseWrapper(pooled, 'bench_pooled').close_pool()
+    return results
@@ -0,0 +1,150 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import receiver
+
+from .signals import todos_changed
+
+VERSION_KEY = 'todo:version:{user_id}'
+FRAGMENT_KEY = 'todo:fragment:{name}:{user_id}:{version}:{variant}'
+STATS_KEYS = {'hits': 'todo:stats:hits', 'misses': 'todo:stats:misses'}
+
+
+def get_cache():
+    return caches[settings.TODO_CACHE_ALIAS]
+
+
+def new_version():
+    # Time based rather than starting at 1, so a version key that was evicted
+    # can never come back as a value older fragments were stored under.
+    return time.time_ns()
+
+
+def get_version(user_id):
+    cache = get_cache()
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        version = new_version()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_version(user_id):
+    cache = get_cache()
+    key = VERSION_KEY.format(user_id=user_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = new_version()
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_versions(user_ids):
+    """
+    Invalidates every cached fragment of the given users at once.
+    """
+    if settings.TODO_READ_REPLICAS:
+        from .routers import mark_writes
+
+        # Whoever made the change, the users read from the primary until
+        # the replicas have it.
+        mark_writes(user_ids)
+    cache = get_cache()
+    for user_id in user_ids:
+        key = VERSION_KEY.format(user_id=user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), timeout=None)
+
+
+def increment(key, timeout=None):
+    cache = get_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=timeout):
+            return 1
+        return cache.incr(key)
+
+
+def record(outcome):
+    increment(STATS_KEYS[outcome])
+
+
+async def arecord(outcome):
+    cache = get_cache()
+    key = STATS_KEYS[outcome]
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, timeout=None):
+            await cache.aincr(key)
+
+
+def get_stats():
+    values = get_cache().get_many(STATS_KEYS.values())
+    return {outcome: values.get(key, 0) for outcome, key in STATS_KEYS.items()}
+
+
+def reset_stats():
+    get_cache().delete_many(STATS_KEYS.values())
+
+
+def cached_fragment(user_id, name, variant, render):
+    """
+    Returns ``render()`` for this user, fragment name and variant (e.g. the
+    query string), reusing the cached value until the user's todos change.
+    """
+    if not settings.TODO_CACHE_TIMEOUT:
+        return render()
+
+    cache = get_cache()
+    variant = hashlib.md5(variant.encode(), usedforsecurity=False).hexdigest()
+    key = FRAGMENT_KEY.format(name=name, user_id=user_id, version=get_version(user_id), variant=variant)
+
+    value = cache.get(key)
+    if value is not None:
+        record('hits')
+        return value
+
+    record('misses')
+    value = render()
+    cache.set(key, value, timeout=settings.TODO_CACHE_TIMEOUT)
+    return value
+
+
+async def acached_fragment(user_id, name, variant, render):
+    """
+    Async ``cached_fragment``; ``render`` is a coroutine function.
+    """
+    if not settings.TODO_CACHE_TIMEOUT:
+        return await render()
+
+    cache = get_cache()
+    variant = hashlib.md5(variant.encode(), usedforsecurity=False).hexdigest()
+    key = FRAGMENT_KEY.format(name=name, user_id=user_id, version=await aget_version(user_id), variant=variant)
+
+    value = await cache.aget(key)
+    if value is not None:
+        await arecord('hits')
+        return value
+
+    await arecord('misses')
+    value = await render()
+    await cache.aset(key, value, timeout=settings.TODO_CACHE_TIMEOUT)
+    return value
+
+
+@receiver(todos_changed)
+def invalidate_fragments(sender, changes, using, **kwargs):
+    user_ids = {state.user_id for pair in changes for state in pair if state is not None}
+    # Not before the commit: a request in between would cache the old rows
+    # under the new version.
+    transaction.on_commit(lambda: bump_versions(user_ids), using=using)
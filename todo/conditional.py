@@ -0,0 +1,63 @@
+"""
+ETag / Last-Modified validators for the list and detail pages.
+
+Django's ``condition`` decorator can't share the lookup it validates with
+the view and calls its functions synchronously, so the views use these
+helpers instead: look up the counters (lists) or the todo (detail) once,
+answer 304 from them or go on to render with the same objects.
+
+Pages embed a CSRF token, so the validators cover the CSRF cookie too: a
+rotated cookie (e.g. after logging in again) never revalidates a page
+carrying a token for the old one.
+"""
+import hashlib
+
+from django.conf import settings
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5('|'.join(map(str, parts)).encode(), usedforsecurity=False).hexdigest())
+
+
+def csrf_cookie(request):
+    # get_token() makes sure there is one, so a page's first ETag already
+    # names the cookie the response sets.
+    get_token(request)
+    return request.META['CSRF_COOKIE']
+
+
+def list_validators(request, name, counters):
+    # The overdue recount changes what's shown without any todo changing.
+    last_modified = max(counters.last_modified, counters.overdue_as_of)
+    etag = make_etag(
+        name, counters.user_id, last_modified.timestamp(), settings.TODO_PAGINATION,
+        request.GET.urlencode(), csrf_cookie(request),
+    )
+    return etag, last_modified
+
+
+def todo_validators(request, todo):
+    etag = make_etag('viewtodo', todo.pk, todo.updated_at.timestamp(), request.GET.urlencode(), csrf_cookie(request))
+    return etag, todo.updated_at
+
+
+def not_modified(request, etag, last_modified):
+    """
+    A 304 response when the request's validators still match, else None.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    return response and with_validators(request, response, etag, last_modified)
+
+
+def with_validators(request, response, etag, last_modified):
+    if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+        # Per-user pages: revalidate every time, never store in shared caches.
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
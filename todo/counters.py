@@ -0,0 +1,182 @@
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, router
+from django.db.models import Case, Count, F, IntegerField, Min, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Least
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ArchivedToDo, ToDo, TodoCounters
+from .sharding import on_user_shard
+from .signals import todos_changed
+
+
+def split_by_user(changes):
+    """
+    Groups ``(before, after)`` pairs by user; a todo moved to another user
+    counts as a delete for the old one and a create for the new one.
+    """
+    by_user = defaultdict(list)
+    for before, after in changes:
+        if before is not None and after is not None and before.user_id != after.user_id:
+            by_user[before.user_id].append((before, None))
+            by_user[after.user_id].append((None, after))
+        else:
+            by_user[(after or before).user_id].append((before, after))
+    return by_user
+
+
+def counter_deltas(pairs):
+    """
+    Returns ``(deltas, overdue_deadlines, new_deadlines)`` for one user's changes.
+
+    ``overdue_deadlines`` maps the deadline of each open todo that appeared
+    (+1) or went away (-1) to its net sign, ``new_deadlines`` are the deadlines
+    of open todos that appeared.
+    """
+    deltas = Counter()
+    overdue_deadlines = Counter()
+    new_deadlines = set()
+
+    for before, after in pairs:
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None:
+                continue
+            if state.done:
+                deltas['completed_count'] += sign
+                continue
+            deltas['open_count'] += sign
+            if state.important:
+                deltas['important_count'] += sign
+            if state.deadline_datetime is not None:
+                overdue_deadlines[state.deadline_datetime] += sign
+                if sign > 0:
+                    new_deadlines.add(state.deadline_datetime)
+
+    return deltas, overdue_deadlines, new_deadlines
+
+
+def overdue_delta(overdue_deadlines, now):
+    """
+    An expression for how much ``overdue_count`` changes: the net sign of
+    every deadline before the row's ``overdue_as_of``.
+
+    ``overdue_as_of`` is never in the future, so only past deadlines can
+    count. They're folded into running totals to build one flat CASE rather
+    than nesting an expression per deadline.
+    """
+    steps = sorted((deadline, sign) for deadline, sign in overdue_deadlines.items() if sign and deadline < now)
+    if not steps:
+        return None
+
+    whens = []
+    total = 0
+    for deadline, sign in steps:
+        total += sign
+        whens.append(When(overdue_as_of__gt=deadline, then=Value(total)))
+    whens.reverse()
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def apply_changes(changes, using=DEFAULT_DB_ALIAS):
+    """
+    Adjusts the counters of every affected user, and stamps their
+    ``last_modified``, with one atomic UPDATE each on the ``using`` database
+    (where the todos changed).
+
+    Users without a counters row are left alone; their row is built from
+    scratch the next time it is read.
+    """
+    now = timezone.now()
+    for user_id, pairs in split_by_user(changes).items():
+        deltas, overdue_deadlines, new_deadlines = counter_deltas(pairs)
+        updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        updates['last_modified'] = now
+
+        overdue = overdue_delta(overdue_deadlines, now)
+        if overdue is not None:
+            updates['overdue_count'] = F('overdue_count') + overdue
+
+        if new_deadlines:
+            earliest = min(new_deadlines)
+            updates['next_deadline'] = Case(
+                When(overdue_as_of__lte=earliest, then=Least(Coalesce('next_deadline', Value(earliest)), Value(earliest))),
+                default=F('next_deadline'),
+            )
+
+        TodoCounters.objects.using(using).filter(user_id=user_id).update(**updates)
+
+
+def count_todos(user_id, now):
+    todos = ToDo.objects.filter(user_id=user_id)
+    totals = todos.aggregate(
+        open_count=Count('id', filter=Q(done=False)),
+        completed_count=Count('id', filter=Q(done=True)),
+        important_count=Count('id', filter=Q(done=False, important=True)),
+        overdue_count=Count('id', filter=Q(done=False, deadline_datetime__lt=now)),
+    )
+    totals['completed_count'] += ArchivedToDo.objects.filter(user_id=user_id).count()
+    totals['next_deadline'] = todos.filter(
+        done=False, deadline_datetime__gte=now,
+    ).aggregate(next_deadline=Min('deadline_datetime'))['next_deadline']
+    totals['overdue_as_of'] = now
+    return totals
+
+
+def rebuild_counters(user_id):
+    now = timezone.now()
+    with on_user_shard(user_id):
+        counters, _ = TodoCounters.objects.update_or_create(
+            user_id=user_id, defaults={**count_todos(user_id, now), 'last_modified': now},
+        )
+    return counters
+
+
+def refresh_overdue(counters, now):
+    todos = ToDo.objects.filter(user_id=OuterRef('user_id'), done=False)
+    overdue = todos.filter(deadline_datetime__lt=now).values('user_id').annotate(n=Count('id')).values('n')
+    upcoming = todos.filter(deadline_datetime__gte=now).order_by('deadline_datetime').values('deadline_datetime')
+
+    # The counters may have been read from a replica; the recount and the
+    # re-read both go to the database that's written.
+    using = router.db_for_write(TodoCounters, instance=counters)
+    TodoCounters.objects.using(using).filter(user_id=counters.user_id).update(
+        overdue_count=Coalesce(Subquery(overdue), 0),
+        next_deadline=Subquery(upcoming[:1]),
+        overdue_as_of=now,
+    )
+    counters.refresh_from_db(using=using)
+
+
+def get_counters(user):
+    """
+    Returns the user's ``TodoCounters``, building the row on first use and
+    recounting overdue todos only after one of their deadlines has passed.
+    """
+    try:
+        counters = TodoCounters.objects.get(user_id=user.pk)
+    except TodoCounters.DoesNotExist:
+        return rebuild_counters(user.pk)
+
+    now = timezone.now()
+    if counters.next_deadline is not None and counters.next_deadline <= now:
+        refresh_overdue(counters, now)
+    return counters
+
+
+async def aget_counters(user):
+    try:
+        counters = await TodoCounters.objects.aget(user_id=user.pk)
+    except TodoCounters.DoesNotExist:
+        return await sync_to_async(rebuild_counters)(user.pk)
+
+    now = timezone.now()
+    if counters.next_deadline is not None and counters.next_deadline <= now:
+        await sync_to_async(refresh_overdue)(counters, now)
+    return counters
+
+
+@receiver(todos_changed)
+def update_counters(sender, changes, using, **kwargs):
+    apply_changes(changes, using)
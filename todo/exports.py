@@ -0,0 +1,104 @@
+import csv
+import json
+
+from django.db.models import Value
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+EXPORT_FIELDS = ('id', 'title', 'description', 'important', 'done', 'creation_date', 'deadline_datetime', 'recurrence')
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_CHUNK_SIZE = 2000
+
+BOOLEANS = {'1': True, 'true': True, 'yes': True, '0': False, 'false': False, 'no': False}
+
+
+def parse_bool(value):
+    try:
+        return BOOLEANS[value.lower()]
+    except KeyError:
+        raise ValueError(f"Expected true or false, got {value!r}")
+
+
+def parse_deadline(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f"Expected an ISO 8601 datetime, got {value!r}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_filters(params):
+    """
+    Reads the optional ``done``, ``important``, ``deadline_after`` and
+    ``deadline_before`` filters from a mapping of strings (e.g. ``request.GET``).
+
+    Raises ValueError for values that can't be parsed.
+    """
+    filters = {}
+    for name in ('done', 'important'):
+        if params.get(name):
+            filters[name] = parse_bool(params[name])
+    if params.get('deadline_after'):
+        filters['deadline_datetime__gte'] = parse_deadline(params['deadline_after'])
+    if params.get('deadline_before'):
+        filters['deadline_datetime__lt'] = parse_deadline(params['deadline_before'])
+    return filters
+
+
+def exported_archive(archive, filters):
+    """
+    The archived todos (all completed) matching ``filters``, with the
+    fields they lack filled in, or None when the filters rule them out.
+    """
+    if filters.get('done') is False:
+        return None
+    filters = {name: value for name, value in filters.items() if name != 'done'}
+    return archive.filter(**filters).annotate(done=Value(True), recurrence=Value(''))
+
+
+def export_rows(querysets, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields one tuple of EXPORT_FIELDS per todo of each queryset in turn,
+    reading ``chunk_size`` rows at a time so memory use doesn't depend on
+    how many todos there are.
+    """
+    for queryset in querysets:
+        rows = queryset.order_by('id').values_list(*EXPORT_FIELDS)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield tuple(value.isoformat() if hasattr(value, 'isoformat') else value for value in row)
+
+
+def iter_ndjson(querysets, chunk_size=EXPORT_CHUNK_SIZE):
+    for row in export_rows(querysets, chunk_size):
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
+
+
+class Echo:
+    """
+    File-like object whose write() hands the line back to the csv writer's caller.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(querysets, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in export_rows(querysets, chunk_size):
+        yield writer.writerow(row)
+
+
+def iter_export(queryset, export_format, archive=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Streams ``queryset`` followed by ``archive`` (from ``exported_archive``),
+    if given, in ``export_format``.
+    """
+    querysets = [queryset] if archive is None else [queryset, archive]
+    if export_format == 'csv':
+        return iter_csv(querysets, chunk_size)
+    return iter_ndjson(querysets, chunk_size)
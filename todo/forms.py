@@ -10,12 +10,13 @@ class TodoForm(ModelForm):
 
     class Meta:
         model = ToDo
-        fields = ['title', 'description', 'deadline_datetime', 'important']
+        fields = ['title', 'description', 'deadline_datetime', 'recurrence', 'important']
         widgets = {
             'deadline_datetime': forms.DateTimeInput(
                 attrs={'type': 'datetime-local', 'class': 'custom-date'},
                 format="%Y-%m-%dT%H:%M",
             ),
+            'recurrence': forms.Select(attrs={'class': 'custom-select'}),
             'important': forms.CheckboxInput(attrs={'class': 'custom-checkbox'}),
             'title': forms.TextInput(attrs={'class': 'custom-input', 'placeholder': 'What needs to be done?', 'maxlength':100}),
             'description': forms.Textarea(attrs={'class': 'custom-textarea', 'placeholder': 'Add more details about this task...', 'rows': 4}),
@@ -27,6 +28,25 @@ class TodoForm(ModelForm):
         self.label_suffix = ""
         self.fields['deadline_datetime'].input_formats = ["%Y-%m-%dT%H:%M"]
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('recurrence') and not cleaned_data.get('deadline_datetime'):
+            self.add_error('recurrence', 'A repeating task needs a due date to repeat from.')
+        return cleaned_data
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(widget=forms.ClearableFileInput(attrs={'class': 'custom-input'}))
+    format = forms.ChoiceField(
+        choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')],
+        widget=forms.Select(attrs={'class': 'custom-select'}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.label_suffix = ""
+
 
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(
@@ -0,0 +1,149 @@
+import csv
+import json
+
+from django.utils import timezone
+
+from .exports import parse_bool, parse_deadline
+from .forms import TodoForm
+from .models import ToDo
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult:
+    """
+    Outcome of an import; only the first ``max_errors`` row errors are kept,
+    but every one is passed to ``on_error`` if given.
+    """
+
+    def __init__(self, max_errors=MAX_REPORTED_ERRORS, on_error=None):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.on_error = on_error
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if self.on_error is not None:
+            self.on_error(line, message)
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+
+def read_rows(stream, import_format):
+    """
+    Yields ``(line_number, row)`` for each record of a text stream, where
+    ``row`` is a dict, or a string describing why the line couldn't be parsed.
+    """
+    if import_format == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as error:
+                # A malformed record (say, an oversized field) fails alone;
+                # DictReader only updates its line_num for good rows.
+                yield reader.reader.line_num, f'Invalid CSV: {error}'
+                continue
+            yield reader.line_num, row
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, 'Invalid JSON'
+            continue
+        yield line_number, row if isinstance(row, dict) else 'Expected a JSON object'
+
+
+def read_deadline(row):
+    """
+    The record's deadline: ISO 8601 as exported (seconds, UTC offset and
+    all), or the form's own "YYYY-MM-DDTHH:MM"; naive ones are in the
+    current time zone. None if it has none.
+    """
+    value = row.get('deadline_datetime')
+    if not value:
+        return None
+    try:
+        return parse_deadline(str(value))
+    except ValueError as error:
+        raise ValueError(f'deadline_datetime: {error}')
+
+
+def form_data(row, deadline=None):
+    """
+    Maps an imported record onto TodoForm's POST data.
+    """
+    data = {
+        'title': row.get('title') or '',
+        'description': row.get('description') or '',
+        # The form only takes minutes; build_todo() puts the rest back.
+        'deadline_datetime': f'{timezone.localtime(deadline):%Y-%m-%dT%H:%M}' if deadline else '',
+        'recurrence': row.get('recurrence') or '',
+    }
+    important = row.get('important')
+    if isinstance(important, str):
+        important = parse_bool(important) if important else False
+    if important:
+        data['important'] = 'on'
+    return data
+
+
+def build_todo(row, user):
+    """
+    Validates one record with TodoForm and returns an unsaved ToDo.
+
+    Raises ValueError with the first validation error.
+    """
+    deadline = read_deadline(row)
+    form = TodoForm(data=form_data(row, deadline))
+    if not form.is_valid():
+        field, errors = next(iter(form.errors.items()))
+        raise ValueError(f'{field}: {errors[0]}' if field != '__all__' else errors[0])
+
+    todo = form.save(commit=False)
+    todo.user = user
+    todo.deadline_datetime = deadline
+    done = row.get('done')
+    if isinstance(done, str):
+        done = parse_bool(done) if done else False
+    todo.done = bool(done)
+    return todo
+
+
+def import_todos(user, rows, batch_size=IMPORT_BATCH_SIZE, result=None):
+    """
+    Creates todos for ``user`` from ``(line_number, row)`` pairs.
+
+    Valid rows are written with ``bulk_create`` every ``batch_size`` rows, each
+    batch in its own transaction; invalid rows are recorded on the returned
+    ImportResult and skipped.
+    """
+    result = result or ImportResult()
+    batch = []
+
+    for line, row in rows:
+        if isinstance(row, str):
+            result.add_error(line, row)
+            continue
+        try:
+            batch.append(build_todo(row, user))
+        except ValueError as error:
+            result.add_error(line, str(error))
+            continue
+
+        if len(batch) >= batch_size:
+            result.created += len(ToDo.objects.create_tracked(batch))
+            batch = []
+
+    if batch:
+        result.created += len(ToDo.objects.create_tracked(batch))
+    return result
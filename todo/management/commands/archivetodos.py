@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.archive import archive_todos
+
+
+class Command(BaseCommand):
+    help = "Move completed todos untouched for --older-than days into the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=90, help="Days since the todo was last changed.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows moved per transaction.")
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--older-than must be >= 0 and --batch-size >= 1")
+
+        archived = archive_todos(
+            timedelta(days=options['older_than']), options['batch_size'],
+            progress=lambda total: self.stdout.write(f"Archived {total} todo(s) so far"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} todo(s)"))
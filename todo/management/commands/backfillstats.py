@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.stats import backfill_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily stats rollups from the todo and archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only handle the user with this username.")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User \"{options['user']}\" does not exist")
+
+        rebuilt = days = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            days += backfill_stats(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {days} day(s) of stats for {rebuilt} user(s)"))
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.benchmarks import compare_wsgi_asgi
+
+
+class Command(BaseCommand):
+    help = "Compare the sync views under WSGI with the async views under ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="User whose pages are requested.")
+        parser.add_argument('--path', action='append', help="Path to request (repeatable, default: the list pages).")
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User \"{options['username']}\" does not exist")
+
+        for path in options['path'] or ['/current/', '/completed/']:
+            results = compare_wsgi_asgi(user, path, options['requests'], options['concurrency'])
+            for handler, summary in results.items():
+                self.stdout.write(
+                    f"{path:<14} {handler}: {summary['throughput']:8.1f} req/s  "
+                    f"p50 {summary['p50_ms']:7.2f} ms  p95 {summary['p95_ms']:7.2f} ms"
+                )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from todo.benchmarks import compare_pooling
+
+
+class Command(BaseCommand):
+    help = "Compare a fresh connection per request with a connection pool under concurrent load."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Connection pooling needs PostgreSQL (with psycopg 3 and psycopg-pool)")
+
+        results = compare_pooling(options['requests'], options['concurrency'])
+        for mode, summary in results.items():
+            self.stdout.write(
+                f"{mode:<9} {summary['throughput']:8.1f} req/s  "
+                f"p50 {summary['p50_ms']:7.2f} ms  p95 {summary['p95_ms']:7.2f} ms"
+            )
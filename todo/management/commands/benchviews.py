@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.benchmarks import run_view_benchmarks, unbenchmarked_url_names
+
+
+class Command(BaseCommand):
+    help = "Time every view and fail if one runs more SQL queries than its budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="User to run the views as (see seedtodos).")
+        parser.add_argument('--repeat', type=int, default=20, help="Requests per view.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User \"{options['username']}\" does not exist")
+
+        self.stdout.write(f"{'view':<30} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'budget':>7}")
+        failures = 0
+        for result in run_view_benchmarks(user, options['repeat']):
+            line = (
+                f"{result.scenario.label:<30} {result.p50_ms:8.2f} {result.p95_ms:8.2f} "
+                f"{result.queries:8} {result.scenario.budget:7}"
+            )
+            if result.ok:
+                self.stdout.write(line)
+                continue
+            failures += 1
+            self.stdout.write(self.style.ERROR(line + "  " + "; ".join(
+                (["over query budget"] if result.over_budget else []) + result.errors[:1]
+            )))
+
+        missing = unbenchmarked_url_names()
+        if missing:
+            failures += 1
+            self.stdout.write(self.style.ERROR(f"Views without a benchmark: {', '.join(sorted(missing))}"))
+
+        if failures:
+            raise CommandError(f"{failures} benchmark(s) failed")
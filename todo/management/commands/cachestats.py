@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from todo.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show (or with --reset, clear) the todo list cache hit/miss counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters to zero.")
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS("Cache stats reset"))
+            return
+
+        stats = get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(f"hits: {stats['hits']}\nmisses: {stats['misses']}\nhit ratio: {ratio:.1%}")
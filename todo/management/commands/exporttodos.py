@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, exported_archive, iter_export, parse_filters
+from todo.models import ArchivedToDo, ToDo
+from todo.sharding import on_user_shard
+
+
+class Command(BaseCommand):
+    help = "Stream a user's todos, archived ones included, as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help="File to write to (default: stdout).")
+        parser.add_argument('--done', help="Only completed (true) or open (false) todos.")
+        parser.add_argument('--important', help="Only important (true) or other (false) todos.")
+        parser.add_argument('--deadline-after', help="Only todos due at or after this ISO datetime.")
+        parser.add_argument('--deadline-before', help="Only todos due before this ISO datetime.")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User \"{options['username']}\" does not exist")
+
+        try:
+            filters = parse_filters({name: options[name] for name in ('done', 'important', 'deadline_after', 'deadline_before')})
+        except ValueError as error:
+            raise CommandError(error)
+
+        todos = ToDo.objects.filter(user=user, **filters)
+        archive = exported_archive(ArchivedToDo.objects.filter(user=user), filters)
+        lines = iter_export(todos, options['format'], archive, chunk_size=options['chunk_size'])
+
+        with on_user_shard(user.pk):
+            if options['output']:
+                with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                    output.writelines(lines)
+            else:
+                for line in lines:
+                    self.stdout.write(line, ending='')
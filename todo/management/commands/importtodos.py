@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.imports import IMPORT_BATCH_SIZE, IMPORT_FORMATS, ImportResult, import_todos, read_rows
+from todo.sharding import on_user_shard
+
+
+class Command(BaseCommand):
+    help = "Import todos for a user from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=IMPORT_FORMATS,
+            help="File format (default: guessed from the file extension).",
+        )
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User \"{options['username']}\" does not exist")
+
+        import_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        # Errors are written out as they happen instead of being collected.
+        result = ImportResult(max_errors=0, on_error=lambda line, message: self.stderr.write(f"Line {line}: {message}"))
+
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream, on_user_shard(user.pk):
+            import_todos(user, read_rows(stream, import_format), options['batch_size'], result)
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {result.created} todo(s), skipped {result.failed} row(s)"))
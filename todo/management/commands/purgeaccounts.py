@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.accounts import purge_accounts
+
+
+class Command(BaseCommand):
+    help = "Delete the accounts queued for deletion, their data a batch at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows deleted per transaction.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be >= 1")
+
+        purged = purge_accounts(
+            options['batch_size'],
+            progress=lambda user_id, total: self.stdout.write(f"User {user_id}: deleted {total} row(s) so far"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} account(s)"))
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.sharding import move_user, pin_users, stable_shard
+
+
+class Command(BaseCommand):
+    help = "Move users' todos between shards in batches, or pin every user to their current shard."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Users to move.")
+        parser.add_argument('--to', help="Target shard (default: the shard the user's id hashes to).")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows moved per transaction.")
+        parser.add_argument(
+            '--pin-all', action='store_true',
+            help="Record every user's current shard as an override; run it before changing DATABASE_SHARD_URLS.",
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be >= 1")
+        if options['to'] is not None and options['to'] not in settings.TODO_SHARDS:
+            raise CommandError(f"Unknown shard \"{options['to']}\"; shards are {', '.join(settings.TODO_SHARDS)}")
+
+        if options['pin_all']:
+            self.stdout.write(self.style.SUCCESS(f"Pinned {pin_users()} user(s) to their current shard"))
+
+        for username in options['usernames']:
+            try:
+                user = User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User \"{username}\" does not exist")
+
+            target = options['to'] or stable_shard(user.pk)
+            moved = move_user(
+                user.pk, target, options['batch_size'],
+                progress=lambda user_id, total: self.stdout.write(f"{username}: moved {total} row(s) so far"),
+            )
+            self.stdout.write(self.style.SUCCESS(f"{username} is on {target} ({moved} row(s) moved)"))
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.counters import count_todos, rebuild_counters
+from todo.models import TodoCounters
+from todo.sharding import on_user_shard
+
+COUNTER_FIELDS = ('open_count', 'completed_count', 'important_count', 'overdue_count')
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or with --verify, check) the per-user todo counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only handle the user with this username.")
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Compare stored counters with the todo table without changing anything.",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User \"{options['user']}\" does not exist")
+
+        if options['verify']:
+            self.verify(users)
+        else:
+            self.rebuild(users)
+
+    def rebuild(self, users):
+        rebuilt = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            rebuild_counters(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {rebuilt} user(s)"))
+
+    def verify(self, users):
+        mismatched = 0
+        for user in users.only('pk', 'username').iterator():
+            with on_user_shard(user.pk):
+                try:
+                    stored = TodoCounters.objects.get(user_id=user.pk)
+                except TodoCounters.DoesNotExist:
+                    # Missing rows are built lazily on first read, so they're never wrong.
+                    continue
+
+                actual = count_todos(user.pk, stored.overdue_as_of)
+            wrong = [
+                f"{field}={getattr(stored, field)} (actual {actual[field]})"
+                for field in COUNTER_FIELDS if getattr(stored, field) != actual[field]
+            ]
+            if wrong:
+                mismatched += 1
+                self.stdout.write(f"{user.username}: " + ", ".join(wrong))
+
+        if mismatched:
+            raise CommandError(f"{mismatched} user(s) have wrong counters; run rebuildcounters to fix them")
+        self.stdout.write(self.style.SUCCESS("All counters match"))
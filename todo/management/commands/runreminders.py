@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from todo.reminders import get_backend, new_owner, process_batch
+
+
+class Command(BaseCommand):
+    help = "Run a deadline reminder worker; several may run side by side."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=30, help="Seconds to sleep when nothing is due.")
+        parser.add_argument('--once', action='store_true', help="Process what is due now, then exit.")
+
+    def handle(self, *args, **options):
+        owner = new_owner()
+        backend = get_backend()
+        self.stdout.write(f"Reminder worker {owner} started")
+
+        try:
+            while True:
+                claimed = process_batch(owner, backend, options['batch_size'])
+                if claimed:
+                    self.stdout.write(f"Processed {claimed} reminder(s)")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Reminder worker {owner} stopped")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from todo.seeding import seed_todos
+
+
+class Command(BaseCommand):
+    help = "Create N users with M random todos each, for load tests and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--todos', type=int, default=1000, help="Todos per user.")
+        parser.add_argument('--prefix', default='seed', help="Usernames are <prefix>-<n>.")
+        parser.add_argument('--password', default='benchmark')
+        parser.add_argument('--seed', type=int, help="Random seed, for reproducible data.")
+
+    def handle(self, *args, **options):
+        users = seed_todos(
+            options['users'], options['todos'],
+            prefix=options['prefix'], password=options['password'], seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} user(s) with {options['todos']} todo(s) each"
+        ))
@@ -0,0 +1,208 @@
+"""
+In-process request metrics, exposed in the Prometheus text format at /metrics.
+
+Every database connection gets an execute wrapper that adds each query's
+time to the stats of the request being served, found through a context
+variable so it also works for queries the async views run in a worker
+thread. Values are aggregated per process, like prometheus_client's
+default registry: scrape every worker, or run a single one per container.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import throttling
+from .cache import get_stats
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+MAX_LOGGED_QUERIES = 100
+
+current_request = contextvars.ContextVar('todo_current_request', default=None)
+
+
+class RequestStats:
+    """
+    Database time and queries of one request; ``queries`` only keeps the SQL
+    when the request may be logged as slow.
+    """
+
+    def __init__(self, keep_sql=False):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.query_count = 0
+        self.queries = [] if keep_sql else None
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add_query(self, sql, duration):
+        self.db_time += duration
+        self.query_count += 1
+        if self.queries is not None and len(self.queries) < MAX_LOGGED_QUERIES:
+            self.queries.append((sql, duration))
+
+
+def time_query(execute, sql, params, many, context):
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """
+    Per-view request counters and histograms, guarded by a single lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.durations = {}
+        self.db_durations = {}
+        self.query_counts = {}
+
+    def observe(self, view, method, status, stats):
+        elapsed = stats.elapsed
+        with self.lock:
+            key = (view, method, f'{status // 100}xx')
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for histograms, buckets, value in (
+                (self.durations, DURATION_BUCKETS, elapsed),
+                (self.db_durations, DURATION_BUCKETS, stats.db_time),
+                (self.query_counts, QUERY_BUCKETS, stats.query_count),
+            ):
+                if view not in histograms:
+                    histograms[view] = Histogram(buckets)
+                histograms[view].observe(value)
+
+    def snapshot(self):
+        with self.lock:
+            return (
+                dict(self.requests),
+                *(
+                    {view: (list(h.counts), h.sum) for view, h in histograms.items()}
+                    for histograms in (self.durations, self.db_durations, self.query_counts)
+                ),
+            )
+
+
+registry = Registry()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def labels(**values):
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in values.items()) + '}'
+
+
+def histogram_lines(name, help_text, buckets, histograms):
+    yield f'# HELP {name} {help_text}'
+    yield f'# TYPE {name} histogram'
+    for view, (counts, total) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*buckets, '+Inf'), counts):
+            cumulative += count
+            yield f'{name}_bucket{labels(view=view, le=bound)} {cumulative}'
+        yield f'{name}_sum{labels(view=view)} {total}'
+        yield f'{name}_count{labels(view=view)} {cumulative}'
+
+
+def counter_lines(name, help_text, samples):
+    yield f'# HELP {name} {help_text}'
+    yield f'# TYPE {name} counter'
+    for sample_labels, value in samples:
+        yield f'{name}{labels(**sample_labels)} {value}'
+
+
+def gauge_lines(name, help_text, samples):
+    yield f'# HELP {name} {help_text}'
+    yield f'# TYPE {name} gauge'
+    for sample_labels, value in samples:
+        yield f'{name}{labels(**sample_labels)} {value}'
+
+
+def pool_stats():
+    """
+    ``{alias: stats}`` of the psycopg connection pools in use (DB_POOL).
+    """
+    return {
+        alias: connections[alias].pool.get_stats()
+        for alias in connections
+        if connections.settings[alias].get('OPTIONS', {}).get('pool')
+    }
+
+
+def pool_lines():
+    pools = pool_stats()
+    if not pools:
+        return
+    for name, help_text, key, kind, scale in (
+        ('todo_db_pool_size', 'Connections open in the pool.', 'pool_size', gauge_lines, 1),
+        ('todo_db_pool_max_size', 'Largest the pool may grow.', 'pool_max', gauge_lines, 1),
+        ('todo_db_pool_available', 'Idle connections in the pool.', 'pool_available', gauge_lines, 1),
+        ('todo_db_pool_waiting', 'Requests waiting for a connection now.', 'requests_waiting', gauge_lines, 1),
+        ('todo_db_pool_requests_total', 'Connections requested from the pool.', 'requests_num', counter_lines, 1),
+        ('todo_db_pool_queued_total', 'Requests that had to wait for a connection.', 'requests_queued', counter_lines, 1),
+        ('todo_db_pool_wait_seconds_total', 'Time spent waiting for a connection.', 'requests_wait_ms', counter_lines, 1000),
+        ('todo_db_pool_timeouts_total', 'Requests that gave up waiting.', 'requests_errors', counter_lines, 1),
+        ('todo_db_pool_connections_total', 'Connections the pool opened.', 'connections_num', counter_lines, 1),
+        ('todo_db_pool_connect_seconds_total', 'Time spent opening connections.', 'connections_ms', counter_lines, 1000),
+    ):
+        yield from kind(name, help_text, [
+            ({'alias': alias}, stats.get(key, 0) / scale if scale > 1 else stats.get(key, 0))
+            for alias, stats in pools.items()
+        ])
+
+
+def render_metrics():
+    requests, durations, db_durations, query_counts = registry.snapshot()
+    lines = [
+        *counter_lines('todo_requests_total', 'Requests served, by view, method and status class.', [
+            ({'view': view, 'method': method, 'status': status}, count)
+            for (view, method, status), count in sorted(requests.items())
+        ]),
+        *histogram_lines('todo_request_duration_seconds', 'Wall time per request.', DURATION_BUCKETS, durations),
+        *histogram_lines('todo_request_db_seconds', 'Database time per request.', DURATION_BUCKETS, db_durations),
+        *histogram_lines('todo_request_queries', 'SQL queries per request.', QUERY_BUCKETS, query_counts),
+        *counter_lines('todo_list_cache_total', 'Todo list fragment cache lookups, by outcome.', [
+            ({'outcome': outcome}, count) for outcome, count in get_stats().items()
+        ]),
+        *counter_lines('todo_login_attempts_total', 'Failed and throttled login attempts, by outcome.', [
+            ({'outcome': outcome}, count) for outcome, count in throttling.get_stats().items()
+        ]),
+        *pool_lines(),
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,180 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from .metrics import RequestStats, current_request, registry
+from .routers import mark_write, replica_view, use_replica, wrote_recently
+from .sharding import current_shard, request_user_shard, shard_state, sharded
+
+slow_logger = logging.getLogger('todo.slow_requests')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class InstrumentationMiddleware:
+    """
+    Times every request and its SQL, records them per URL name in the
+    metrics registry and reports them in a ``Server-Timing`` header.
+
+    Requests slower than ``TODO_SLOW_REQUEST_MS`` are logged with their
+    queries. Put it first in ``MIDDLEWARE`` so the other middleware's
+    queries (sessions, auth) count too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = settings.TODO_SLOW_REQUEST_MS
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats(keep_sql=self.slow_ms is not None)
+        token = current_request.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats(keep_sql=self.slow_ms is not None)
+        token = current_request.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        registry.observe(view, request.method, response.status_code, stats)
+
+        elapsed_ms = stats.elapsed * 1000
+        response['Server-Timing'] = (
+            f'app;dur={elapsed_ms:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries"'
+        )
+
+        if self.slow_ms is not None and elapsed_ms >= self.slow_ms:
+            slow_logger.warning(
+                'Slow request: %s %s (%s) took %.0f ms, %.0f ms in %d queries\n%s',
+                request.method, request.path, view, elapsed_ms, stats.db_time * 1000, stats.query_count,
+                '\n'.join(f'  {duration * 1000:7.1f} ms  {sql}' for sql, duration in stats.queries),
+            )
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets read-only views (see ``todo.routers.replica_view``) read from the
+    replicas, unless the user wrote something in the last
+    ``TODO_REPLICA_STICKY_SECONDS``; any unsafe request counts as a write.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TODO_READ_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        self.remember_write(request)
+        return response
+
+    async def __acall__(self, request):
+        token = use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        if request.method not in SAFE_METHODS:
+            user_id = await request.session.aget(SESSION_KEY)
+            if user_id:
+                await sync_to_async(mark_write)(user_id)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The session (already loaded from the primary) names the user
+        # without a query.
+        user_id = request.session.get(SESSION_KEY)
+        if replica_view(request) and not (user_id and wrote_recently(user_id)):
+            use_replica.set(True)
+
+    def remember_write(self, request):
+        if request.method not in SAFE_METHODS:
+            user_id = request.session.get(SESSION_KEY)
+            if user_id:
+                mark_write(user_id)
+
+
+class ShardRoutingMiddleware:
+    """
+    Routes the request's queries on the sharded models to the logged-in
+    user's shard (see todo.sharding), and turns the user away with a 503
+    while their data is being moved to another shard.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not sharded():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is None:
+            return self.get_response(request)
+        shard, moving = shard_state(user_id)
+        if moving:
+            return self.moving_response()
+        tokens = current_shard.set(shard), request_user_shard.set((int(user_id), shard))
+        try:
+            return self.get_response(request)
+        finally:
+            request_user_shard.reset(tokens[1])
+            current_shard.reset(tokens[0])
+
+    async def __acall__(self, request):
+        user_id = await request.session.aget(SESSION_KEY)
+        if user_id is None:
+            return await self.get_response(request)
+        shard, moving = await sync_to_async(shard_state)(user_id)
+        if moving:
+            return self.moving_response()
+        tokens = current_shard.set(shard), request_user_shard.set((int(user_id), shard))
+        try:
+            return await self.get_response(request)
+        finally:
+            request_user_shard.reset(tokens[1])
+            current_shard.reset(tokens[0])
+
+    def moving_response(self):
+        response = HttpResponse('Your tasks are being moved. Please try again in a minute.', status=503)
+        response['Retry-After'] = '60'
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0005_todo_done_alter_todo_description'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'done', 'deadline_datetime', 'id'], name='todo_user_done_deadline_idx'),
+        ),
+    ]
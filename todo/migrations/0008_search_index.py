@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from todo.search import install_search
+
+    install_search(schema_editor.connection, rebuild=True)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from todo.search import uninstall_search
+
+    uninstall_search(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0007_todocounters'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:05
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    ToDo = apps.get_model('todo', 'ToDo')
+    ToDo.objects.update(updated_at=F('creation_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0009_todo_reminders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='todocounters',
+            name='last_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
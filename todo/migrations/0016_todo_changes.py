@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0015_sharding'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ToDoChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('todo_id', models.BigIntegerField(db_index=True)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(0, 'Changed'), (1, 'Deleted'), (2, 'Reset')], default=0)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='todo_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'seq'], name='todochange_user_seq_idx')],
+            },
+        ),
+    ]
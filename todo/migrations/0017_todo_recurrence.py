@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0016_todo_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='recurrence',
+            field=models.CharField(blank=True, choices=[('', 'Does not repeat'), ('daily', 'Daily'), ('weekdays', 'Every weekday'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], default='', max_length=10),
+        ),
+    ]
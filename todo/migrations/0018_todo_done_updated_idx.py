@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0017_todo_recurrence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('done', True)), fields=['updated_at', 'id'], name='todo_done_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0019_user_data_purged_by_accounts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='next_occurrence_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
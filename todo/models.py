@@ -1,17 +1,350 @@
 import datetime
+from collections import namedtuple
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# Written only by queryset updates (see todo.reminders), so saving an
+# instance never undoes a lease taken or a reminder sent since it was loaded.
+REMINDER_FIELDS = ('reminder_sent_at', 'reminder_lease_until', 'reminder_lease_owner')
+
+# The fields bookkeeping (counters, caches, ...) cares about, captured
+# before and after every change to a todo.
+TodoState = namedtuple(
+    'TodoState',
+    [
+        'id', 'user_id', 'done', 'important', 'deadline_datetime', 'creation_date', 'completed_at', 'recurrence',
+        'next_occurrence_id',
+    ],
+)
+
+
+class ToDoQuerySet(models.QuerySet):
+    """
+    Set-based writes that still report every affected todo through
+    ``todos_changed``, unlike plain ``update()``/``delete()``.
+    """
+
+    def _states(self):
+        # Locks the rows (where supported) so the reported changes match what the write does.
+        rows = self.order_by().select_for_update().values_list(*TodoState._fields)
+        return [TodoState(*row) for row in rows]
+
+    def create_tracked(self, todos, batch_size=None):
+        """
+        ``bulk_create()`` the given todos in one transaction and report them.
+        """
+        from .signals import todos_changed
+
+        now = timezone.now()
+        for todo in todos:
+            if todo.done and todo.completed_at is None:
+                todo.completed_at = now
+
+        with transaction.atomic(using=self.db):
+            created = self.bulk_create(todos, batch_size=batch_size)
+            changes = [(None, todo.state()) for todo in created]
+            todos_changed.send(sender=self.model, changes=changes, using=self.db)
+        return created
+
+    def update_tracked(self, **fields):
+        """
+        Applies ``fields`` to every todo in the queryset with a single UPDATE
+        and returns the number of rows changed; ``updated_at`` is set too
+        unless given, and ``completed_at`` when ``done`` is. Reopening todos
+        or moving their deadline re-arms their reminders, as saving does.
+        """
+        from .signals import todos_changed
+
+        now = timezone.now()
+        fields.setdefault('updated_at', now)
+        # Completing keeps the completion time of rows that were already done.
+        stamp_completion = fields.get('done') is True and 'completed_at' not in fields
+        if stamp_completion:
+            fields['completed_at'] = Coalesce('completed_at', Value(now))
+        elif fields.get('done') is False:
+            fields.setdefault('completed_at', None)
+        if fields.get('done') is False or 'deadline_datetime' in fields:
+            fields.setdefault('reminder_sent_at', None)
+
+        with transaction.atomic(using=self.db):
+            before = self._states()
+            if not before:
+                return 0
+            updated = self.filter(pk__in=[state.id for state in before]).update(**fields)
+
+            tracked = {field: value for field, value in fields.items() if field in TodoState._fields}
+            changes = []
+            for state in before:
+                if stamp_completion:
+                    tracked['completed_at'] = state.completed_at or now
+                changes.append((state, state._replace(**tracked)))
+            todos_changed.send(sender=self.model, changes=changes, using=self.db)
+        return updated
+
+    def delete_tracked(self):
+        """
+        Deletes every todo in the queryset with a single DELETE, skipping the
+        per-object collector, and returns the number of rows deleted.
+        """
+        from .signals import todos_changed
+
+        with transaction.atomic(using=self.db):
+            before = self._states()
+            if not before:
+                return 0
+            deleted = self.filter(pk__in=[state.id for state in before])._raw_delete(self.db)
+
+            changes = [(state, None) for state in before]
+            todos_changed.send(sender=self.model, changes=changes, using=self.db)
+        return deleted
+
 
 class ToDo(models.Model):
+    class Recurrence(models.TextChoices):
+        NONE = '', 'Does not repeat'
+        DAILY = 'daily', 'Daily'
+        WEEKDAYS = 'weekdays', 'Every weekday'
+        WEEKLY = 'weekly', 'Weekly'
+        MONTHLY = 'monthly', 'Monthly'
+
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     important = models.BooleanField(default=False)
     done = models.BooleanField(default=False)
     creation_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(blank=True, null=True, editable=False)
     deadline_datetime = models.DateTimeField(blank=True ,null=True)
-    user = models.ForeignKey(to=User, on_delete=models.CASCADE)
+    # No database constraint: with sharding, users live on another database,
+    # out of the cascade's reach; todo.accounts deletes the rows instead.
+    user = models.ForeignKey(to=User, on_delete=models.DO_NOTHING, db_constraint=False)
+    # Repeats from the deadline; completing the todo creates the next one
+    # and hands the rule on to it (see todo.recurrence).
+    recurrence = models.CharField(max_length=10, choices=Recurrence.choices, blank=True, default=Recurrence.NONE)
+    # The occurrence completing this one created, removed again if this one
+    # is reopened while it's still open.
+    next_occurrence_id = models.BigIntegerField(blank=True, null=True, editable=False)
+    # Deadline reminders, see todo.reminders.
+    reminder_sent_at = models.DateTimeField(blank=True, null=True, editable=False)
+    reminder_lease_until = models.DateTimeField(blank=True, null=True, editable=False)
+    reminder_lease_owner = models.CharField(max_length=64, blank=True, editable=False)
+
+    objects = ToDoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves the keyset-paginated current/completed lists.
+            models.Index(fields=['user', 'done', 'deadline_datetime', 'id'], name='todo_user_done_deadline_idx'),
+            # Serves the reminder worker's "due soon" scans.
+            models.Index(fields=['done', 'deadline_datetime'], name='todo_done_deadline_idx'),
+            # Serves the admin's "important" filter, newest first.
+            models.Index(fields=['-id'], condition=models.Q(important=True), name='todo_important_idx'),
+            # Serves the archiver's "completed before the cutoff" scans, oldest first.
+            models.Index(fields=['updated_at', 'id'], condition=models.Q(done=True), name='todo_done_updated_idx'),
+        ]
+
+    # State as last read from / written to the database, see todo.signals.
+    _loaded_state = None
+
+    def __str__(self):
+        return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not set(TodoState._fields) & instance.get_deferred_fields():
+            instance._loaded_state = instance.state()
+        return instance
+
+    def state(self):
+        return TodoState(*(getattr(self, field) for field in TodoState._fields))
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = self._fields_to_save(kwargs.get('using'))
+        super().save(*args, **kwargs)
+
+    def _fields_to_save(self, using):
+        # Every loaded field but the reminder ones; None (a full save) if the
+        # row is gone.
+        before = self._loaded_state
+        if before is None:
+            stored = ToDo.objects.using(using or router.db_for_write(ToDo, instance=self)).filter(pk=self.pk).first()
+            if stored is None:
+                return None
+            before = self._loaded_state = stored.state()
+
+        deferred = self.get_deferred_fields()
+        fields = [
+            field.attname for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred and field.attname not in REMINDER_FIELDS
+        ]
+        # A moved deadline or a reopened todo deserves a fresh reminder.
+        if before.deadline_datetime != self.deadline_datetime or before.done != self.done:
+            self.reminder_sent_at = None
+            fields.append('reminder_sent_at')
+        return fields
+
+    def upcoming_occurrences(self):
+        """
+        The deadlines of the next few repeats after this one, which don't
+        exist as todos until this one is completed.
+        """
+        from .recurrence import upcoming
+
+        if not self.recurrence or self.deadline_datetime is None:
+            return []
+        return upcoming(self.deadline_datetime, self.recurrence)
+
+
+class ArchivedToDo(models.Model):
+    """
+    A completed todo moved out of the hot table by ``manage.py archivetodos``.
+
+    It keeps its original id, so moving a row twice (say, after a batch was
+    interrupted) is harmless, and its fields, so completed lists can show it
+    after the hot rows.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    important = models.BooleanField(default=False)
+    creation_date = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    completed_at = models.DateTimeField(blank=True, null=True)
+    deadline_datetime = models.DateTimeField(blank=True, null=True)
+    user = models.ForeignKey(to=User, on_delete=models.DO_NOTHING, related_name='archived_todos', db_constraint=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    # Archived rows are completed todos; lets templates treat both alike.
+    done = True
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            # Serves the keyset-paginated completed list.
+            models.Index(fields=['user', 'deadline_datetime', 'id'], name='archived_user_deadline_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+
+class TodoCounters(models.Model):
+    """
+    Per-user task totals kept up to date on every todo change, so list pages
+    never have to COUNT(*) the todo table.
+
+    ``completed_count`` includes archived todos. ``overdue_count`` counts
+    open todos whose deadline is before ``overdue_as_of``; it is recounted
+    once ``next_deadline`` (the earliest open deadline not yet counted as
+    overdue) has passed. ``last_modified`` is when any of the user's todos
+    last changed.
+    """
+    user = models.OneToOneField(
+        to=User, on_delete=models.DO_NOTHING, primary_key=True, related_name='todo_counters', db_constraint=False,
+    )
+    open_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    important_count = models.IntegerField(default=0)
+    overdue_count = models.IntegerField(default=0)
+    overdue_as_of = models.DateTimeField()
+    next_deadline = models.DateTimeField(blank=True, null=True)
+    last_modified = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = 'todo counters'
+
+    def __str__(self):
+        return f'Counters for {self.user}'
+
+
+
+class DailyStats(models.Model):
+    """
+    Per-user, per-day todo totals for the stats dashboard, kept up to date
+    on every todo change (see todo.stats).
+
+    ``created`` counts the day's todos by creation date, ``completed`` and
+    ``completed_late`` (after the deadline) by completion date; deleting a
+    todo takes it back out of both.
+    """
+    user = models.ForeignKey(to=User, on_delete=models.DO_NOTHING, related_name='daily_stats', db_constraint=False)
+    day = models.DateField()
+    created = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    completed_late = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily stats'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='dailystats_user_day_unique'),
+        ]
+
+    def __str__(self):
+        return f'Stats for {self.user} on {self.day}'
+
+
+class AccountDeletion(models.Model):
+    """
+    An account queued for deletion: the user was deactivated when this was
+    created, and ``manage.py purgeaccounts`` deletes their data in batches
+    and the user last (see todo.accounts).
+    """
+    user = models.OneToOneField(to=User, on_delete=models.CASCADE, primary_key=True, related_name='account_deletion')
+    requested_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'Deletion of {self.user}'
+
+
+class ShardOverride(models.Model):
+    """
+    Pins a user's data to a shard other than the one their id hashes to
+    (see todo.sharding); ``moving`` is set while ``manage.py rebalanceshards``
+    copies it over.
+    """
+    user = models.OneToOneField(to=User, on_delete=models.CASCADE, primary_key=True, related_name='shard_override')
+    shard = models.CharField(max_length=100)
+    moving = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'{self.user} on {self.shard}'
+
+
+class ToDoChange(models.Model):
+    """
+    The latest change to a todo, for incremental sync (see todo.sync).
+
+    Every change replaces the todo's row with a new one, so ``seq`` only
+    grows and a user's rows past a client's cursor are exactly the todos
+    that changed since; a deleted todo leaves a tombstone. A ``RESET`` row
+    marks where a user's data was moved onto this shard with new ids.
+    """
+
+    class Kind(models.IntegerChoices):
+        CHANGED = 0
+        DELETED = 1
+        RESET = 2
+
+    seq = models.BigAutoField(primary_key=True)
+    # Indexed together with seq below.
+    user = models.ForeignKey(
+        to=User, on_delete=models.DO_NOTHING, related_name='todo_changes', db_constraint=False, db_index=False,
+    )
+    todo_id = models.BigIntegerField(db_index=True)
+    kind = models.PositiveSmallIntegerField(choices=Kind.choices, default=Kind.CHANGED)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Serves every sync: the user's rows past the cursor.
+            models.Index(fields=['user', 'seq'], name='todochange_user_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} todo {self.todo_id}'
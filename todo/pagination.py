@@ -0,0 +1,322 @@
+import base64
+import binascii
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import F, Q
+
+TODOS_PER_PAGE = 4
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class Cursor:
+    """
+    Position of a row in the ``-deadline_datetime, -id`` ordering (nulls last).
+
+    The page number is carried along only so templates can keep showing
+    "Showing X-Y" and the current page; it is never used for querying.
+    ``archived`` tells whether the row is in the archive, which is paged
+    after the hot rows.
+    """
+
+    def __init__(self, deadline, pk, number, archived=False):
+        self.deadline = deadline
+        self.pk = pk
+        self.number = number
+        self.archived = archived
+
+    @classmethod
+    def for_row(cls, todo, number):
+        return cls(todo.deadline_datetime, todo.pk, number, getattr(todo, 'is_archived', False))
+
+    def encode(self):
+        deadline = self.deadline.isoformat() if self.deadline is not None else ''
+        raw = f'{self.number}|{deadline}|{self.pk}' + ('|a' if self.archived else '')
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, value):
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+            number, deadline, pk, *flags = raw.split('|')
+            if flags not in ([], ['a']):
+                raise ValueError(raw)
+            deadline = datetime.fromisoformat(deadline) if deadline else None
+            return cls(deadline, int(pk), max(int(number), 1), archived=bool(flags))
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            raise InvalidCursor(value)
+
+
+class CursorPage:
+    """
+    A page of todos fetched by keyset, mirroring the parts of
+    ``django.core.paginator.Page`` the list templates use.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, number, per_page, has_next, has_previous, count=None):
+        self.object_list = object_list
+        self.count = count
+        self.number = number
+        self.per_page = per_page
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.per_page + 1
+
+    def end_index(self):
+        return (self.number - 1) * self.per_page + len(self.object_list)
+
+    def next_cursor(self):
+        if self._has_next:
+            return Cursor.for_row(self.object_list[-1], self.number + 1).encode()
+
+    def previous_cursor(self):
+        if self._has_previous:
+            return Cursor.for_row(self.object_list[0], self.number - 1).encode()
+
+
+def keyset_order(queryset):
+    return queryset.order_by(F('deadline_datetime').desc(nulls_last=True), '-id')
+
+
+def forward_querysets(queryset, cursor):
+    """
+    Querysets for the rows after ``cursor``, in display order.
+
+    Dated and undated rows are fetched separately so each part is a plain
+    range scan over the ``(user, done, deadline_datetime, id)`` index,
+    whatever order the backend sorts NULLs in.
+    """
+    dated = queryset.filter(deadline_datetime__isnull=False).order_by('-deadline_datetime', '-id')
+    undated = queryset.filter(deadline_datetime__isnull=True).order_by('-id')
+
+    if cursor is None:
+        return [dated, undated]
+    if cursor.deadline is None:
+        return [undated.filter(id__lt=cursor.pk)]
+    dated = dated.filter(
+        Q(deadline_datetime__lt=cursor.deadline) |
+        Q(deadline_datetime=cursor.deadline, id__lt=cursor.pk)
+    )
+    return [dated, undated]
+
+
+def backward_querysets(queryset, cursor):
+    """
+    Querysets for the rows before ``cursor`` (all of them if None), nearest
+    first (reverse display order).
+    """
+    dated = queryset.filter(deadline_datetime__isnull=False).order_by('deadline_datetime', 'id')
+    undated = queryset.filter(deadline_datetime__isnull=True).order_by('id')
+
+    if cursor is None:
+        return [undated, dated]
+    if cursor.deadline is None:
+        return [undated.filter(id__gt=cursor.pk), dated]
+    dated = dated.filter(
+        Q(deadline_datetime__gt=cursor.deadline) |
+        Q(deadline_datetime=cursor.deadline, id__gt=cursor.pk)
+    )
+    return [dated]
+
+
+def chained_forward_querysets(queryset, archive, cursor):
+    """
+    ``forward_querysets`` over ``queryset`` followed by ``archive``, if any.
+    """
+    if archive is None:
+        return forward_querysets(queryset, cursor)
+    if cursor is not None and cursor.archived:
+        return forward_querysets(archive, cursor)
+    return forward_querysets(queryset, cursor) + forward_querysets(archive, None)
+
+
+def chained_backward_querysets(queryset, archive, cursor):
+    if archive is None or not cursor.archived:
+        return backward_querysets(queryset, cursor)
+    return backward_querysets(archive, cursor) + backward_querysets(queryset, None)
+
+
+def fetch_rows(querysets, limit):
+    rows = []
+    for queryset in querysets:
+        if len(rows) >= limit:
+            break
+        rows.extend(queryset[:limit - len(rows)])
+    return rows
+
+
+async def afetch_rows(querysets, limit):
+    rows = []
+    for queryset in querysets:
+        if len(rows) >= limit:
+            break
+        rows.extend([row async for row in queryset[:limit - len(rows)]])
+    return rows
+
+
+def build_page(rows, cursor, backward, per_page, count=None):
+    """
+    Turn ``per_page + 1`` fetched rows into a ``CursorPage``.
+    """
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backward:
+        rows.reverse()
+        return CursorPage(rows, cursor.number, per_page, has_next=True, has_previous=has_more, count=count)
+
+    number = cursor.number if cursor is not None else 1
+    return CursorPage(rows, number, per_page, has_next=has_more, has_previous=cursor is not None, count=count)
+
+
+def read_cursor(request):
+    """
+    Returns ``(cursor, backward)`` from the ``after``/``before`` query parameters.
+    """
+    for param, backward in (('after', False), ('before', True)):
+        value = request.GET.get(param)
+        if value:
+            try:
+                return Cursor.decode(value), backward
+            except InvalidCursor:
+                break
+    return None, False
+
+
+def cursor_page(queryset, request, count=None, per_page=TODOS_PER_PAGE, archive=None):
+    cursor, backward = read_cursor(request)
+
+    if backward:
+        rows = fetch_rows(chained_backward_querysets(queryset, archive, cursor), per_page + 1)
+    else:
+        rows = fetch_rows(chained_forward_querysets(queryset, archive, cursor), per_page + 1)
+
+    if not rows and cursor is not None:
+        # A stale cursor pointing past the end falls back to the first page,
+        # like EmptyPage does for the numbered paginator.
+        rows = fetch_rows(chained_forward_querysets(queryset, archive, None), per_page + 1)
+        cursor, backward = None, False
+
+    return build_page(rows, cursor, backward, per_page, count)
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator that trusts a count it is given instead of running COUNT(*).
+    """
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+
+
+async def acursor_page(queryset, request, count=None, per_page=TODOS_PER_PAGE, archive=None):
+    cursor, backward = read_cursor(request)
+
+    if backward:
+        rows = await afetch_rows(chained_backward_querysets(queryset, archive, cursor), per_page + 1)
+    else:
+        rows = await afetch_rows(chained_forward_querysets(queryset, archive, cursor), per_page + 1)
+
+    if not rows and cursor is not None:
+        rows = await afetch_rows(chained_forward_querysets(queryset, archive, None), per_page + 1)
+        cursor, backward = None, False
+
+    return build_page(rows, cursor, backward, per_page, count)
+
+
+class ChainedRows:
+    """
+    Two querysets sliced as one list, all of the first's rows before the
+    second's, for the numbered paginator.
+    """
+
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+        self._first_count = None
+
+    def first_count(self):
+        if self._first_count is None:
+            self._first_count = self.first.count()
+        return self._first_count
+
+    def count(self):
+        return self.first_count() + self.second.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        start, stop = key.start or 0, key.stop
+        split = self.first_count()
+        rows = list(self.first[start:min(stop, split)]) if start < split else []
+        if stop > split:
+            rows.extend(self.second[max(start - split, 0):stop - split])
+        return rows
+
+
+def offset_page(queryset, request, count=None, per_page=TODOS_PER_PAGE, archive=None):
+    rows = keyset_order(queryset)
+    if archive is not None:
+        rows = ChainedRows(rows, keyset_order(archive))
+    if count is None:
+        paginator = Paginator(rows, per_page)
+    else:
+        paginator = CountedPaginator(rows, per_page, count)
+    page = request.GET.get('page', 1)
+
+    try:
+        return paginator.page(page)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def paginate_todos(queryset, request, count=None, archive=None):
+    """
+    Paginates a user's todos using the mode selected by ``TODO_PAGINATION``.
+
+    ``count`` is the known number of rows in ``queryset`` (and ``archive``),
+    if any; ``archive`` holds archived todos to page after ``queryset``.
+    """
+    if settings.TODO_PAGINATION == 'offset':
+        return offset_page(queryset, request, count, archive=archive)
+    return cursor_page(queryset, request, count, archive=archive)
+
+
+async def apaginate_todos(queryset, request, count=None, archive=None):
+    if settings.TODO_PAGINATION == 'offset':
+        # Paginator has no async API; the numbered mode stays a sync call.
+        return await sync_to_async(offset_page)(queryset, request, count, archive=archive)
+    return await acursor_page(queryset, request, count, archive=archive)
@@ -0,0 +1,131 @@
+"""
+Recurring todos, stored one occurrence at a time.
+
+A repeating todo is a single row with a ``recurrence`` rule. Completing it,
+by whatever path, creates the next occurrence (the first deadline of the
+rule that is still ahead) and moves the rule onto it, so the table grows
+with the completed history rather than with how far ahead the rule
+reaches; the lists show the occurrences after that one without storing
+them (``ToDo.upcoming_occurrences``).
+
+A done todo that still has a rule is one whose next occurrence wasn't
+created yet; its next change creates it.
+
+Reopening a completed todo takes its completion back: the occurrence it
+created (``next_occurrence_id``) is deleted, if nobody has completed that
+one in turn, and the rule returns to the reopened todo, so there is never
+a second open copy.
+"""
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ToDo
+from .signals import todos_changed
+
+UPCOMING_OCCURRENCES = 3
+
+
+def add_months(moment, months):
+    month = moment.month - 1 + months
+    year, month = moment.year + month // 12, month % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(deadline, rule):
+    # Steps in local time, so a daily 9:00 stays at 9:00 across DST changes.
+    moment = timezone.localtime(deadline).replace(tzinfo=None)
+    if rule == ToDo.Recurrence.DAILY:
+        moment += timedelta(days=1)
+    elif rule == ToDo.Recurrence.WEEKDAYS:
+        moment += timedelta(days=1)
+        while moment.weekday() >= 5:
+            moment += timedelta(days=1)
+    elif rule == ToDo.Recurrence.WEEKLY:
+        moment += timedelta(weeks=1)
+    elif rule == ToDo.Recurrence.MONTHLY:
+        moment = add_months(moment, 1)
+    else:
+        raise ValueError(f'Unknown recurrence {rule!r}')
+    return timezone.make_aware(moment)
+
+
+def upcoming(deadline, rule, count=UPCOMING_OCCURRENCES):
+    occurrences = []
+    for _ in range(count):
+        deadline = next_occurrence(deadline, rule)
+        occurrences.append(deadline)
+    return occurrences
+
+
+def next_pending(deadline, rule, now):
+    """
+    The first occurrence after ``deadline`` that is still ahead of ``now``:
+    occurrences missed while the todo was open are skipped.
+    """
+    deadline = next_occurrence(deadline, rule)
+    while deadline <= now:
+        deadline = next_occurrence(deadline, rule)
+    return deadline
+
+
+@receiver(todos_changed)
+def create_next_occurrences(sender, changes, using, **kwargs):
+    ids = [
+        after.id for before, after in changes
+        if after is not None and after.done and after.recurrence and after.deadline_datetime is not None
+    ]
+    if not ids:
+        return
+
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        # Locked and re-read, so completing the same todo twice at once
+        # creates its next occurrence only once.
+        completed = list(
+            ToDo.objects.using(using).filter(pk__in=ids, done=True, deadline_datetime__isnull=False)
+            .exclude(recurrence=ToDo.Recurrence.NONE).select_for_update()
+        )
+        if not completed:
+            return
+        ToDo.objects.using(using).filter(pk__in=[todo.pk for todo in completed]).update_tracked(
+            recurrence=ToDo.Recurrence.NONE,
+        )
+        created = ToDo.objects.using(using).create_tracked([
+            ToDo(
+                user_id=todo.user_id, title=todo.title, description=todo.description, important=todo.important,
+                recurrence=todo.recurrence, deadline_datetime=next_pending(todo.deadline_datetime, todo.recurrence, now),
+            )
+            for todo in completed
+        ])
+        for todo, occurrence in zip(completed, created):
+            todo.next_occurrence_id = occurrence.pk
+        ToDo.objects.using(using).bulk_update(completed, ['next_occurrence_id'])
+
+
+@receiver(todos_changed)
+def remove_reopened_occurrences(sender, changes, using, **kwargs):
+    reopened = {
+        before.next_occurrence_id: before.id for before, after in changes
+        if before is not None and after is not None and before.done and not after.done and before.next_occurrence_id
+    }
+    if not reopened:
+        return
+
+    todos = ToDo.objects.using(using)
+    with transaction.atomic(using=using):
+        # A completed occurrence carries the series on by itself.
+        occurrences = list(todos.filter(pk__in=reopened, done=False).select_for_update().values_list('pk', 'recurrence'))
+        todos.filter(pk__in=reopened.values()).update(next_occurrence_id=None)
+        todos.filter(pk__in=[pk for pk, rule in occurrences]).delete_tracked()
+
+        rules = defaultdict(list)
+        for pk, rule in occurrences:
+            if rule:
+                rules[rule].append(reopened[pk])
+        for rule, ids in rules.items():
+            todos.filter(pk__in=ids).update_tracked(recurrence=rule)
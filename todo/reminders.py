@@ -0,0 +1,157 @@
+"""
+Deadline reminders.
+
+Workers (``manage.py runreminders``) repeatedly claim a batch of open todos
+due within ``TODO_REMINDER_WINDOW`` by writing a short lease on them, hand
+the batch to the configured backend and mark what was delivered as sent;
+what failed to go out is released and claimed again once its lease would
+have run out, without holding back or repeating the rest of the batch.
+Candidate rows are locked with SELECT ... FOR UPDATE SKIP LOCKED where the
+database supports it; elsewhere (SQLite) the conditional lease UPDATE alone
+decides which worker gets a row. A worker that dies mid-batch leaves its
+lease to expire, so reminders are delivered at least once. The reminder
+fields are only ever written by the queryset updates here (and cleared by
+``ToDo.save()``/``update_tracked()`` when a todo needs reminding again).
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ToDo
+from .sharding import each_shard
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderBackend:
+    """
+    Delivers reminders; subclasses implement ``send()``.
+    """
+
+    def send(self, todos):
+        """
+        Delivers a reminder for each todo (with ``user`` loaded) and returns
+        the ids of those that are done with, delivered or not deliverable;
+        the rest are tried again later.
+        """
+        raise NotImplementedError
+
+
+class EmailReminderBackend(ReminderBackend):
+    """
+    Sends one email per reminder through Django's configured email backend,
+    over a single connection; a message that fails is logged and retried.
+    """
+
+    def send(self, todos):
+        handled = []
+        with get_connection() as connection:
+            for todo in todos:
+                if todo.user.email:
+                    deadline = timezone.localtime(todo.deadline_datetime).strftime('%H:%M, %b %d %Y')
+                    message = EmailMessage(
+                        subject=f'Reminder: "{todo.title}" is due {deadline}',
+                        body=f'Your task "{todo.title}" is due at {deadline}.\n\n{todo.description}'.rstrip(),
+                        to=[todo.user.email],
+                        connection=connection,
+                    )
+                    try:
+                        message.send()
+                    except Exception:
+                        logger.exception('Sending the reminder for todo %s failed', todo.pk)
+                        continue
+                handled.append(todo.pk)
+        return handled
+
+
+def get_backend():
+    return import_string(settings.TODO_REMINDER_BACKEND)()
+
+
+def new_owner():
+    return uuid.uuid4().hex
+
+
+def due_todos(now):
+    window = timedelta(minutes=settings.TODO_REMINDER_WINDOW)
+    # Deadlines missed by more than the grace period (e.g. while no worker
+    # was running) are skipped rather than reminded about late.
+    grace = timedelta(minutes=settings.TODO_REMINDER_GRACE)
+    return ToDo.objects.filter(
+        done=False,
+        reminder_sent_at__isnull=True,
+        deadline_datetime__gte=now - grace,
+        deadline_datetime__lte=now + window,
+    )
+
+
+def claim_batch(owner, batch_size, now=None):
+    """
+    Leases up to ``batch_size`` due todos to ``owner`` and returns them.
+    """
+    now = now or timezone.now()
+    lease = timedelta(seconds=settings.TODO_REMINDER_LEASE)
+    unleased = Q(reminder_lease_until__isnull=True) | Q(reminder_lease_until__lt=now)
+
+    with transaction.atomic(using=router.db_for_write(ToDo)):
+        candidates = due_todos(now).filter(unleased).order_by('deadline_datetime')
+        if connections[candidates.db].features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        ToDo.objects.filter(unleased, id__in=ids).update(
+            reminder_lease_until=now + lease, reminder_lease_owner=owner,
+        )
+
+    # Not select_related(): with sharding, users live on another database.
+    return list(ToDo.objects.filter(id__in=ids, reminder_lease_owner=owner).prefetch_related('user'))
+
+
+def mark_sent(owner, ids, now=None):
+    return ToDo.objects.filter(id__in=ids, reminder_lease_owner=owner).update(
+        reminder_sent_at=now or timezone.now(), reminder_lease_until=None, reminder_lease_owner='',
+    )
+
+
+def release(owner, ids, retry_at):
+    """
+    Hands ``owner``'s leases on ``ids`` back, to be claimed again from
+    ``retry_at``.
+    """
+    return ToDo.objects.filter(id__in=ids, reminder_lease_owner=owner).update(
+        reminder_lease_until=retry_at, reminder_lease_owner='',
+    )
+
+
+def process_batch(owner, backend, batch_size):
+    """
+    Claims, delivers and marks one batch per shard; returns how many were
+    claimed. Reminders the backend didn't deliver are logged and released
+    to be retried after the lease.
+    """
+    claimed = 0
+    for shard in each_shard():
+        todos = claim_batch(owner, batch_size)
+        if todos:
+            try:
+                handled = set(backend.send(todos))
+            except Exception:
+                # Say, the mail server is down: nothing in the batch went out.
+                logger.exception('Delivering %d reminder(s) on %s failed', len(todos), shard)
+                handled = set()
+            if handled:
+                mark_sent(owner, handled)
+            failed = [todo.pk for todo in todos if todo.pk not in handled]
+            if failed:
+                logger.warning('Retrying %d reminder(s) on %s after the lease', len(failed), shard)
+                release(owner, failed, timezone.now() + timedelta(seconds=settings.TODO_REMINDER_LEASE))
+        claimed += len(todos)
+    return claimed
@@ -0,0 +1,70 @@
+"""
+Read-replica routing.
+
+``ReplicaRoutingMiddleware`` marks the requests whose reads may be served
+by a replica (see ``replica_view``); ``ReplicaRouter`` then sends their
+reads to one of ``TODO_READ_REPLICAS``. Everything else, writes included,
+uses the primary. A user who wrote something keeps reading from the
+primary for ``TODO_REPLICA_STICKY_SECONDS``, so they never see a page
+older than their own change while the replicas catch up; so does a user
+whose todos someone else changed (an admin action, the archiver, ...), as
+``bump_versions`` marks them too.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .cache import get_cache
+
+LAST_WRITE_KEY = 'todo:last_write:{user_id}'
+REPLICA_VIEWS = ('currenttodos', 'completedtodos', 'viewtodo')
+
+use_replica = contextvars.ContextVar('todo_use_replica', default=False)
+
+
+def replica_view(request):
+    """
+    Whether the view serving ``request`` only reads: the list and detail
+    pages and the admin changelists, on GET or HEAD.
+    """
+    match = request.resolver_match
+    if match is None or request.method not in ('GET', 'HEAD'):
+        return False
+    if 'admin' in match.namespaces:
+        return match.url_name is not None and match.url_name.endswith('_changelist')
+    return match.url_name in REPLICA_VIEWS
+
+
+def mark_write(user_id):
+    mark_writes([user_id])
+
+
+def mark_writes(user_ids):
+    get_cache().set_many(
+        {LAST_WRITE_KEY.format(user_id=user_id): True for user_id in user_ids},
+        timeout=settings.TODO_REPLICA_STICKY_SECONDS,
+    )
+
+
+def wrote_recently(user_id):
+    return get_cache().get(LAST_WRITE_KEY.format(user_id=user_id)) is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        # Related objects may live elsewhere (see todo.sharding).
+        if isinstance(instance, model) and instance._state.db:
+            return instance._state.db
+        if use_replica.get() and settings.TODO_READ_REPLICAS:
+            return random.choice(settings.TODO_READ_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
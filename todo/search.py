@@ -0,0 +1,179 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .models import ToDo
+
+SEARCH_PER_PAGE = 10
+
+# The search index lives outside the ORM so the database keeps it in sync by
+# itself, including for bulk writes: a generated tsvector column with a GIN
+# index on PostgreSQL, an external-content FTS5 table with triggers on SQLite.
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE todo_todo ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS todo_todo_search_idx ON todo_todo USING GIN (search_vector)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS todo_todo_search_idx",
+    "ALTER TABLE todo_todo DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todo_todo_fts USING fts5(
+        title, description, content='todo_todo', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_todo_fts_insert AFTER INSERT ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_todo_fts_delete AFTER DELETE ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(todo_todo_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_todo_fts_update AFTER UPDATE OF title, description ON todo_todo BEGIN
+        INSERT INTO todo_todo_fts(todo_todo_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO todo_todo_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS todo_todo_fts_insert",
+    "DROP TRIGGER IF EXISTS todo_todo_fts_delete",
+    "DROP TRIGGER IF EXISTS todo_todo_fts_update",
+    "DROP TABLE IF EXISTS todo_todo_fts",
+]
+
+
+def install_search(connection, rebuild=False):
+    """
+    Creates the search index for ``connection`` if it's missing.
+
+    SQLite drops triggers whenever a migration rebuilds todo_todo, so this is
+    also run after every migrate; ``rebuild`` reindexes the existing rows.
+    """
+    if connection.vendor == 'postgresql':
+        statements = POSTGRES_INSTALL
+    elif connection.vendor == 'sqlite':
+        statements = SQLITE_INSTALL
+        if rebuild:
+            statements = statements + ["INSERT INTO todo_todo_fts(todo_todo_fts) VALUES ('rebuild')"]
+    else:
+        return
+
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall_search(connection):
+    statements = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+@receiver(post_migrate)
+def reinstall_search(sender, using, plan=None, **kwargs):
+    if sender.name == 'todo' and plan is not None:
+        connection = connections[using]
+        if 'todo_todo' in connection.introspection.table_names():
+            install_search(connection)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)[:16]
+
+
+class SearchPage:
+    def __init__(self, object_list, number, has_next):
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self._has_next or self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def ranked_sql(connection, terms):
+    """
+    Returns ``(sql, params)`` selecting a user's matching todos best first,
+    with ``user_id``, ``LIMIT`` and ``OFFSET`` placeholders still to fill.
+    """
+    columns = ', '.join(f't.{connection.ops.quote_name(field.column)}' for field in ToDo._meta.concrete_fields)
+
+    if connection.vendor == 'postgresql':
+        expression = ' & '.join(terms) + ':*'
+        sql = f"""
+            SELECT {columns} FROM todo_todo t, to_tsquery('english', %s) query
+            WHERE t.user_id = %s AND t.search_vector @@ query
+            ORDER BY ts_rank(t.search_vector, query) DESC, t.id DESC
+            LIMIT %s OFFSET %s
+        """
+        return sql, [expression]
+
+    expression = ' '.join('"%s"' % term for term in terms) + '*'
+    sql = f"""
+        SELECT {columns} FROM todo_todo_fts JOIN todo_todo t ON t.id = todo_todo_fts.rowid
+        WHERE todo_todo_fts MATCH %s AND t.user_id = %s
+        ORDER BY bm25(todo_todo_fts, 10.0, 1.0), t.id DESC
+        LIMIT %s OFFSET %s
+    """
+    return sql, [expression]
+
+
+def search_todos(user, query, page=1, per_page=SEARCH_PER_PAGE):
+    """
+    Returns a SearchPage of the user's todos matching ``query`` in the title
+    or description, ranked by relevance.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return SearchPage([], 1, False)
+
+    offset = (page - 1) * per_page
+    connection = connections[ToDo.objects.db]
+
+    if connection.vendor in ('postgresql', 'sqlite'):
+        sql, params = ranked_sql(connection, terms)
+        rows = list(ToDo.objects.raw(sql, params + [user.pk, per_page + 1, offset]))
+    else:
+        matches = Q()
+        for term in terms:
+            matches &= Q(title__icontains=term) | Q(description__icontains=term)
+        rows = list(ToDo.objects.filter(matches, user=user).order_by('-id')[offset:offset + per_page + 1])
+
+    return SearchPage(rows[:per_page], page, len(rows) > per_page)
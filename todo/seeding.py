@@ -0,0 +1,60 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .models import ToDo
+from .sharding import on_user_shard
+
+WORDS = (
+    'call', 'email', 'review', 'plan', 'write', 'fix', 'buy', 'book', 'pay', 'clean', 'prepare', 'update',
+    'report', 'invoice', 'groceries', 'dentist', 'meeting', 'slides', 'budget', 'garden', 'car', 'tickets',
+    'release', 'backlog', 'taxes', 'birthday', 'presentation', 'contract', 'laundry', 'workout',
+)
+
+
+def random_todo(user, now, rng):
+    """
+    An unsaved todo with a realistic mix of states: about 40% completed,
+    20% important and 15% without a deadline; deadlines cluster around now,
+    completed todos' mostly in the past.
+    """
+    done = rng.random() < 0.4
+    deadline = None
+    if rng.random() >= 0.15:
+        offset = rng.gauss(-10 if done else 5, 20)
+        deadline = now + timedelta(days=offset, minutes=rng.randrange(0, 24 * 60, 15))
+
+    title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).capitalize()
+    description = ' '.join(rng.choice(WORDS) for _ in range(rng.choice((0, 0, 5, 12, 30))))
+    return ToDo(
+        user=user, title=title, description=description, done=done,
+        important=rng.random() < 0.2, deadline_datetime=deadline,
+    )
+
+
+def seed_todos(users, todos_per_user, prefix='seed', password='benchmark', batch_size=1000, seed=None):
+    """
+    Creates ``users`` users named ``<prefix>-<n>`` (reusing existing ones),
+    each with ``todos_per_user`` random todos, and returns the users.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    password_hash = make_password(password)
+
+    names = [f'{prefix}-{n}' for n in range(users)]
+    existing = set(User.objects.filter(username__in=names).values_list('username', flat=True))
+    User.objects.bulk_create(
+        [User(username=name, email=f'{name}@example.com', password=password_hash) for name in names if name not in existing],
+        batch_size=batch_size,
+    )
+
+    seeded = list(User.objects.filter(username__in=names).order_by('pk'))
+    for user in seeded:
+        with on_user_shard(user.pk):
+            for start in range(0, todos_per_user, batch_size):
+                count = min(batch_size, todos_per_user - start)
+                ToDo.objects.create_tracked([random_todo(user, now, rng) for _ in range(count)])
+    return seeded
@@ -0,0 +1,213 @@
+"""
+User-sharded storage.
+
+With ``DATABASE_SHARD_URLS`` set, each user's todos, archive, counters and
+daily stats live on one of ``TODO_SHARDS`` (the default database is the
+first), picked by a stable hash of the user id unless a ``ShardOverride``
+pins the user elsewhere. Users, sessions and everything else stay on the
+default database.
+
+``ShardRouter`` sends saves and deletes to their instance's shard and other
+queries on the sharded models to ``current_shard``: the request user's
+shard (set by ``ShardRoutingMiddleware``) or whatever ``on_shard()`` pins,
+e.g. in management commands looping over the shards.
+
+``move_user`` (``manage.py rebalanceshards``) copies a user's rows to
+another shard in batches; their requests are answered with a 503 until it
+is done. Moved todos get new ids on their new shard, which sync clients
+learn from the ``RESET`` change left there (see todo.sync).
+"""
+import contextlib
+import contextvars
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, Value, When
+
+from .cache import bump_versions
+from .models import ArchivedToDo, DailyStats, ShardOverride, ToDo, ToDoChange, TodoCounters
+
+SHARDED_MODELS = (ToDo, ArchivedToDo, TodoCounters, DailyStats, ToDoChange)
+
+current_shard = contextvars.ContextVar('todo_current_shard', default=None)
+# ``(user_id, shard)`` of the request's user, looked up once per request.
+request_user_shard = contextvars.ContextVar('todo_request_user_shard', default=None)
+
+
+def sharded():
+    return len(settings.TODO_SHARDS) > 1
+
+
+def stable_shard(user_id):
+    shards = settings.TODO_SHARDS
+    digest = hashlib.blake2b(str(int(user_id)).encode(), digest_size=8).digest()
+    return shards[int.from_bytes(digest, 'big') % len(shards)]
+
+
+def shard_state(user_id):
+    """
+    Returns ``(shard, moving)`` for the user.
+    """
+    if not sharded():
+        return DEFAULT_DB_ALIAS, False
+    user_id = int(user_id)
+    known = request_user_shard.get()
+    if known is not None and known[0] == user_id:
+        return known[1], False
+    override = ShardOverride.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('shard', 'moving')
+    return override.first() or (stable_shard(user_id), False)
+
+
+def shard_for(user_id):
+    return shard_state(user_id)[0]
+
+
+@contextlib.contextmanager
+def on_shard(alias):
+    token = current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        current_shard.reset(token)
+
+
+def on_user_shard(user_id):
+    return on_shard(shard_for(user_id))
+
+
+def each_shard():
+    """
+    Pins each shard in turn, for work that covers every user.
+    """
+    for alias in settings.TODO_SHARDS:
+        with on_shard(alias):
+            yield alias
+
+
+class ShardRouter:
+    """
+    Routes the sharded models; for every other model it has no opinion, so
+    the next router (or the default database) decides.
+    """
+
+    def route(self, model, hints):
+        if not sharded() or model not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, model) and instance._state.db:
+            return instance._state.db
+        if isinstance(instance, User):
+            # A relation followed from (or assigned to) a user.
+            return shard_for(instance.pk)
+        if isinstance(instance, SHARDED_MODELS) and instance.user_id is not None:
+            return shard_for(instance.user_id)
+        return current_shard.get()
+
+    def db_for_read(self, model, **hints):
+        return self.route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.route(model, hints)
+
+
+# Links to the next occurrence point at ids the new shard doesn't have.
+TODO_FIELDS = [
+    field.attname for field in ToDo._meta.concrete_fields if not field.primary_key and field.name != 'next_occurrence_id'
+]
+# Archived todos go back to the hot table on their new shard, which has its
+# own id sequence; the archiver moves them out again.
+ARCHIVED_FIELDS = [
+    field.attname for field in ArchivedToDo._meta.concrete_fields if not field.primary_key and field.name != 'archived_at'
+]
+
+
+def restore_dates(todos, rows):
+    # bulk_create() stamps auto_now(_add) fields; put the originals back.
+    for field in ('creation_date', 'updated_at'):
+        todos.update(**{field: Case(
+            *[When(pk=todo.pk, then=Value(getattr(row, field))) for todo, row in rows],
+            output_field=ToDo._meta.get_field(field),
+        )})
+
+
+def copy_batch(model, user_id, source, target, batch_size):
+    """
+    Moves up to ``batch_size`` of the user's ``model`` rows from ``source``
+    to ``target`` and returns how many were moved.
+
+    The copy commits before the originals are deleted, so a crash between
+    the two can at worst leave one batch on both shards, never on neither.
+    """
+    with transaction.atomic(using=source):
+        rows = list(model.objects.using(source).filter(user_id=user_id).order_by('pk').select_for_update()[:batch_size])
+        if not rows:
+            return 0
+        with transaction.atomic(using=target):
+            if model is DailyStats:
+                DailyStats.objects.using(target).bulk_create(
+                    [DailyStats(user_id=row.user_id, day=row.day, created=row.created, completed=row.completed,
+                                completed_late=row.completed_late) for row in rows],
+                    ignore_conflicts=True,
+                )
+            else:
+                fields = TODO_FIELDS if model is ToDo else ARCHIVED_FIELDS
+                extra = {'done': True} if model is ArchivedToDo else {}
+                todos = ToDo.objects.using(target).bulk_create(
+                    [ToDo(**extra, **{field: getattr(row, field) for field in fields}) for row in rows]
+                )
+                restore_dates(ToDo.objects.using(target).filter(pk__in=[todo.pk for todo in todos]), list(zip(todos, rows)))
+                ToDoChange.objects.using(target).bulk_create([ToDoChange(user_id=user_id, todo_id=todo.pk) for todo in todos])
+        originals = model.objects.using(source).filter(pk__in=[row.pk for row in rows])
+        originals._raw_delete(source)
+    return len(rows)
+
+
+def move_user(user_id, target, batch_size=500, progress=None):
+    """
+    Moves the user's data to the ``target`` shard and returns how many rows
+    were moved.
+    """
+    source, _ = shard_state(user_id)
+    if source == target:
+        return 0
+    ShardOverride.objects.update_or_create(user_id=user_id, defaults={'shard': source, 'moving': True})
+    # Kept from an interrupted move, as the todos copied since sync after it.
+    markers = ToDoChange.objects.using(target).filter(user_id=user_id, kind=ToDoChange.Kind.RESET)
+    if not markers.exists():
+        ToDoChange.objects.using(target).create(user_id=user_id, todo_id=0, kind=ToDoChange.Kind.RESET)
+
+    moved = 0
+    for model in (ToDo, ArchivedToDo, DailyStats):
+        while batch := copy_batch(model, user_id, source, target, batch_size):
+            moved += batch
+            if progress:
+                progress(user_id, moved)
+    # Rebuilt from the moved rows the next time they're read.
+    TodoCounters.objects.using(source).filter(user_id=user_id).delete()
+    # Sync clients start over from the RESET change on the target.
+    changes = ToDoChange.objects.using(source).filter(user_id=user_id)
+    while ids := list(changes.values_list('pk', flat=True)[:batch_size]):
+        ToDoChange.objects.using(source).filter(pk__in=ids)._raw_delete(source)
+
+    if target == stable_shard(user_id):
+        ShardOverride.objects.filter(user_id=user_id).delete()
+    else:
+        ShardOverride.objects.filter(user_id=user_id).update(shard=target, moving=False)
+    bump_versions([user_id])
+    return moved
+
+
+def pin_users():
+    """
+    Records every user's current shard as an override, so changing
+    ``DATABASE_SHARD_URLS`` afterwards moves nobody's data implicitly.
+    Returns how many users were pinned.
+    """
+    pinned = [
+        ShardOverride(user_id=user_id, shard=stable_shard(user_id))
+        for user_id in User.objects.exclude(shard_override__isnull=False).values_list('pk', flat=True).iterator()
+    ]
+    ShardOverride.objects.bulk_create(pinned, batch_size=1000, ignore_conflicts=True)
+    return len(pinned)
@@ -0,0 +1,38 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .models import ToDo
+
+# Sent after one or more todos were created, updated or deleted, whether by
+# a model save/delete or a set-based queryset operation.
+#
+# ``changes`` is a list of ``(before, after)`` TodoState pairs: ``before`` is
+# None for a created todo and ``after`` is None for a deleted one.
+todos_changed = Signal()
+
+
+@receiver(pre_save, sender=ToDo)
+def remember_stored_state(sender, instance, raw, using, **kwargs):
+    # Instances that weren't loaded with all tracked fields (built by hand or
+    # fetched with only()/defer()) need their stored state read back once.
+    if not instance._state.adding and instance._loaded_state is None:
+        stored = ToDo.objects.using(using).filter(pk=instance.pk).first()
+        if stored is not None:
+            instance._loaded_state = stored.state()
+
+
+@receiver(post_save, sender=ToDo)
+def todo_saved(sender, instance, created, using, **kwargs):
+    before = None if created else instance._loaded_state
+    after = instance.state()
+    instance._loaded_state = after
+
+    todos_changed.send(sender=ToDo, changes=[(before, after)], using=using)
+
+
+@receiver(post_delete, sender=ToDo)
+def todo_deleted(sender, instance, using, **kwargs):
+    before = instance._loaded_state or instance.state()
+    instance._loaded_state = None
+
+    todos_changed.send(sender=ToDo, changes=[(before, None)], using=using)
@@ -0,0 +1,41 @@
+// Runs the per-card complete/uncomplete/delete buttons in place: the action
+// answers with JSON (see todo/actions.py), the card is removed and the
+// list's total updated, without reloading and re-rendering the page.
+(function () {
+    const form = document.getElementById('bulk-form');
+    if (!form || !window.fetch) {
+        return;
+    }
+
+    form.addEventListener('submit', async (event) => {
+        const button = event.submitter;
+        if (!button || !button.hasAttribute('data-inplace')) {
+            return;
+        }
+        event.preventDefault();
+        button.disabled = true;
+
+        const response = await fetch(button.formAction, {
+            method: 'POST',
+            headers: {'Accept': 'application/json'},
+            body: new FormData(form, button),
+            credentials: 'same-origin',
+        });
+        if (!response.ok) {
+            // Fall back to the regular form post.
+            form.action = button.formAction;
+            form.submit();
+            return;
+        }
+
+        const result = await response.json();
+        button.closest('.todo-card').remove();
+        document.querySelectorAll('.page-total').forEach((total) => {
+            total.textContent = result.counts[form.dataset.count];
+        });
+        // A repeating task's next occurrence needs a card of its own.
+        if (result.repeats || !document.querySelector('.todos-list .todo-card')) {
+            window.location.reload();
+        }
+    });
+})();
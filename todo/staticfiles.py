@@ -0,0 +1,159 @@
+"""
+Static asset pipeline: fingerprinted, precompressed files served in-process.
+
+``CompressedManifestStaticFilesStorage`` hashes file names at collectstatic
+time, like Django's manifest storage, and writes ``.gz`` (and, when the
+``brotli`` package is installed, ``.br``) variants of text assets next to
+them. ``StaticFilesMiddleware`` serves STATIC_ROOT, choosing a variant by
+Accept-Encoding, and marks hashed files as immutable.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.xml', '.map')
+# Encodings in order of preference, with their file suffix.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+NOT_HASHED = 'public, max-age=60'
+
+
+def compress(content):
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    return variants
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        names = {*paths, *self.hashed_files.values()}
+        for name in sorted(names):
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+                continue
+            with self.open(name) as original:
+                content = original.read()
+            for suffix, compressed in compress(content).items():
+                # Tiny files can come out larger; then the original is served.
+                if len(compressed) < len(content):
+                    with open(self.path(name + suffix), 'wb') as variant:
+                        variant.write(compressed)
+
+
+def accepted_encodings(header):
+    """
+    The encodings an Accept-Encoding header allows (any with q=0 excluded).
+    """
+    accepted = set()
+    for part in header.split(','):
+        encoding, _, params = part.partition(';')
+        quality = params.strip().removeprefix('q=')
+        try:
+            if quality and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    def __init__(self, path, immutable):
+        self.path = path
+        self.cache_control = IMMUTABLE if immutable else NOT_HASHED
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.last_modified = http_date(os.stat(path).st_mtime)
+        self.variants = [
+            (encoding, path + suffix) for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)
+        ]
+
+    def response(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding)
+        path, encoding = self.path, None
+        for variant_encoding, variant_path in self.variants:
+            if variant_encoding in accepted:
+                path, encoding = variant_path, variant_encoding
+                break
+
+        response = FileResponse(open(path, 'rb'), content_type=self.content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if self.variants:
+            response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = self.cache_control
+        response['Last-Modified'] = self.last_modified
+        return response
+
+
+def index_files(root, hashed_names):
+    """
+    Maps the URL path of every collected file (compressed variants aside)
+    under ``root`` to a StaticFile.
+    """
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            files[name] = StaticFile(path, name in hashed_names)
+    return files
+
+
+class StaticFilesMiddleware:
+    """
+    Serves collected static files from STATIC_ROOT before the rest of the
+    stack runs. The directory is indexed once at startup, so run
+    collectstatic before starting the server.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT or not os.path.isdir(settings.STATIC_ROOT):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        self.files = index_files(settings.STATIC_ROOT, hashed_names)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def find(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        name = posixpath.normpath(request.path_info[len(self.prefix):])
+        return self.files.get(name)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        static_file = self.find(request)
+        if static_file is None:
+            return self.get_response(request)
+        return static_file.response(request.headers.get('Accept-Encoding', ''))
+
+    async def __acall__(self, request):
+        static_file = self.find(request)
+        if static_file is None:
+            return await self.get_response(request)
+        return static_file.response(request.headers.get('Accept-Encoding', ''))
@@ -0,0 +1,135 @@
+"""
+Daily productivity rollups.
+
+Every todo change adjusts the ``DailyStats`` rows of the days it touches
+with F() updates, so the dashboard reads a few dozen rows however long a
+user's history is. ``manage.py backfillstats`` rebuilds the rows from the
+todo and archive tables.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ArchivedToDo, DailyStats, ToDo
+from .sharding import on_user_shard
+from .signals import todos_changed
+
+STAT_FIELDS = ('created', 'completed', 'completed_late')
+
+
+def day_of(moment):
+    return timezone.localdate(moment)
+
+
+def stats_deltas(changes):
+    """
+    Returns ``{(user_id, day): Counter(field -> delta)}`` for the changes,
+    without the days whose totals don't move.
+    """
+    deltas = defaultdict(Counter)
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None:
+                continue
+            if state.creation_date is not None:
+                deltas[state.user_id, day_of(state.creation_date)]['created'] += sign
+            if state.done and state.completed_at is not None:
+                day = deltas[state.user_id, day_of(state.completed_at)]
+                day['completed'] += sign
+                if state.deadline_datetime is not None and state.completed_at > state.deadline_datetime:
+                    day['completed_late'] += sign
+
+    return {
+        key: Counter({field: delta for field, delta in fields.items() if delta})
+        for key, fields in deltas.items() if any(fields.values())
+    }
+
+
+def apply_changes(changes, using=DEFAULT_DB_ALIAS):
+    for (user_id, day), fields in stats_deltas(changes).items():
+        updates = {field: F(field) + delta for field, delta in fields.items()}
+        rows = DailyStats.objects.using(using).filter(user_id=user_id, day=day)
+        if rows.update(**updates):
+            continue
+        # A day with only removals was never counted (not backfilled, or
+        # the user is being deleted); there's nothing to take them from.
+        if not any(delta > 0 for delta in fields.values()):
+            continue
+        DailyStats.objects.using(using).bulk_create([DailyStats(user_id=user_id, day=day)], ignore_conflicts=True)
+        rows.update(**updates)
+
+
+@receiver(todos_changed)
+def update_stats(sender, changes, using, **kwargs):
+    apply_changes(changes, using)
+
+
+@receiver(pre_save, sender=ToDo)
+def stamp_completion(sender, instance, **kwargs):
+    if instance.done and instance.completed_at is None:
+        instance.completed_at = timezone.now()
+    elif not instance.done:
+        instance.completed_at = None
+
+
+def count_days(user_id):
+    """
+    Computes a user's ``DailyStats`` from scratch, as ``{day: Counter}``.
+    """
+    days = defaultdict(Counter)
+    for model in (ToDo, ArchivedToDo):
+        todos = model.objects.filter(user_id=user_id)
+        created = todos.order_by().values(day=TruncDate('creation_date')).annotate(n=Count('id'))
+        for day, count in created.values_list('day', 'n'):
+            days[day]['created'] += count
+
+        completed = todos.filter(completed_at__isnull=False)
+        if model is ToDo:
+            completed = completed.filter(done=True)
+        rows = completed.order_by().values(day=TruncDate('completed_at')).annotate(
+            completed=Count('id'),
+            completed_late=Count('id', filter=Q(completed_at__gt=F('deadline_datetime'))),
+        ).values_list('day', 'completed', 'completed_late')
+        for day, completed_count, late in rows:
+            days[day]['completed'] += completed_count
+            days[day]['completed_late'] += late
+    return days
+
+
+def backfill_stats(user_id):
+    with on_user_shard(user_id), transaction.atomic(using=router.db_for_write(DailyStats)):
+        days = count_days(user_id)
+        DailyStats.objects.filter(user_id=user_id).delete()
+        DailyStats.objects.bulk_create([
+            DailyStats(user_id=user_id, day=day, **{field: fields[field] for field in STAT_FIELDS})
+            for day, fields in sorted(days.items())
+        ])
+    return len(days)
+
+
+def dashboard_stats(user, days=30):
+    """
+    The last ``days`` days of stats for ``user``, oldest first and with the
+    quiet days filled in, plus the window's totals.
+    """
+    today = timezone.localdate()
+    first = today - timedelta(days=days - 1)
+    stored = {
+        row.day: row for row in DailyStats.objects.filter(user=user, day__gte=first, day__lte=today)
+    }
+
+    rows = []
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        row = stored.get(day) or DailyStats(user=user, day=day)
+        rows.append(row)
+
+    totals = {field: sum(getattr(row, field) for row in rows) for field in STAT_FIELDS}
+    totals['late_rate'] = totals['completed_late'] / totals['completed'] if totals['completed'] else 0
+    return rows, totals
@@ -0,0 +1,148 @@
+"""
+Incremental sync for API clients (the ``synctodos`` view).
+
+Every todo change replaces the todo's ``ToDoChange`` row with a new one, a
+tombstone if it was deleted, numbered from an ever-growing sequence. A
+client keeps the cursor of its last sync and gets the rows past it: one
+lookup on the ``(user, seq)`` index, which is all a sync with nothing new
+costs. Archiving leaves the rows alone; archived todos are read from the
+archive instead.
+
+Sequence numbers are handed out before transactions commit, so a change
+can become visible after a later one. Cursors therefore only move past
+changes older than ``SETTLE_SECONDS``; newer ones are sent again on the
+next sync, which clients apply idempotently anyway.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ArchivedToDo, ToDo, ToDoChange
+from .sharding import shard_for
+from .signals import todos_changed
+
+SYNC_FIELDS = (
+    'title', 'description', 'important', 'done', 'creation_date', 'updated_at', 'completed_at', 'deadline_datetime',
+    'recurrence',
+)
+ARCHIVED_SYNC_FIELDS = tuple(field for field in SYNC_FIELDS if field not in ('done', 'recurrence'))
+SYNC_BATCH_SIZE = 100
+SYNC_MAX_BATCH_SIZE = 500
+SETTLE_SECONDS = 10
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(shard, seq):
+    return f'{settings.TODO_SHARDS.index(shard)}.{seq}'
+
+
+def decode_cursor(value, shard):
+    """
+    Returns the sequence number in the cursor, or None if it was issued by
+    another shard (the user's data has moved since).
+    """
+    if not value:
+        return 0
+    try:
+        index, seq = (int(part) for part in value.split('.'))
+    except ValueError:
+        raise InvalidCursor(f'Invalid cursor {value!r}.')
+    if index < 0 or seq < 0:
+        raise InvalidCursor(f'Invalid cursor {value!r}.')
+    return seq if index == settings.TODO_SHARDS.index(shard) else None
+
+
+@receiver(todos_changed)
+def record_changes(sender, changes, using, **kwargs):
+    entries = []
+    for before, after in changes:
+        # A todo handed to another user is gone as far as its old owner knows.
+        if before is not None and (after is None or after.user_id != before.user_id):
+            entries.append(ToDoChange(user_id=before.user_id, todo_id=before.id, kind=ToDoChange.Kind.DELETED))
+        if after is not None:
+            entries.append(ToDoChange(user_id=after.user_id, todo_id=after.id))
+    if len(entries) == 1:
+        # bulk_create() would wrap a single save's insert in a transaction.
+        entries[0].save(using=using, force_insert=True)
+        created = entries
+    else:
+        created = ToDoChange.objects.using(using).bulk_create(entries)
+
+    # Dropped after the new rows are in, so a crash in between leaves a
+    # duplicate rather than a todo that never syncs.
+    replaced = [before.id for before, after in changes if before is not None]
+    if replaced:
+        stale = ToDoChange.objects.using(using).filter(todo_id__in=replaced, seq__lt=created[0].seq)
+        stale._raw_delete(using)
+
+
+def read_changes(user, since, limit):
+    return list(ToDoChange.objects.filter(user=user, seq__gt=since).order_by('seq')[:limit + 1])
+
+
+def todo_rows(user, ids):
+    """
+    The current fields of the user's todos with the given ids, by id,
+    whether they're in the hot table or the archive.
+    """
+    if not ids:
+        return {}
+    rows = {row['id']: row for row in ToDo.objects.filter(user=user, id__in=ids).values('id', *SYNC_FIELDS)}
+    archived = set(ids) - rows.keys()
+    if archived:
+        for row in ArchivedToDo.objects.filter(user=user, id__in=archived).values('id', *ARCHIVED_SYNC_FIELDS):
+            rows[row['id']] = {**row, 'done': True, 'recurrence': ToDo.Recurrence.NONE}
+    return rows
+
+
+def sync_batch(user, cursor, limit=SYNC_BATCH_SIZE):
+    """
+    The user's todo changes past ``cursor`` ('' for all of them), at most
+    ``limit``, as a JSON-ready dict with the cursor to send next time.
+
+    ``reset`` is true when the cursor predates a move of the user's data to
+    another shard: the client should drop its copy, as every todo has a new
+    id, and apply these changes from scratch.
+    """
+    shard = shard_for(user.pk)
+    since = decode_cursor(cursor, shard)
+    reset = since is None
+    start = since or 0
+    changes = read_changes(user, start, limit)
+    if start and changes and changes[0].kind == ToDoChange.Kind.RESET:
+        reset, start = True, 0
+        changes = read_changes(user, start, limit)
+
+    more = len(changes) > limit
+    changes = changes[:limit]
+
+    settled = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    seq = start
+    for change in changes:
+        if change.changed_at > settled:
+            break
+        seq = change.seq
+
+    # A todo can show up twice after a crash or a race; the last one wins.
+    deleted = {
+        change.todo_id: change.kind == ToDoChange.Kind.DELETED
+        for change in changes if change.kind != ToDoChange.Kind.RESET
+    }
+    rows = todo_rows(user, [todo_id for todo_id, gone in deleted.items() if not gone])
+    return {
+        'changes': [
+            {'id': todo_id, 'deleted': False, **rows[todo_id]} if todo_id in rows
+            # Deleted since, its tombstone is on the way.
+            else {'id': todo_id, 'deleted': True}
+            for todo_id in deleted
+        ],
+        'cursor': encode_cursor(shard, seq),
+        # Unsettled changes are sent again rather than paged past.
+        'has_more': more and seq > start,
+        'reset': reset,
+    }
@@ -1,3 +1,1106 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.db.models import F
+from django.http import HttpResponse
+from django.templatetags.static import static
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+
+from .accounts import PURGED_MODELS
+from .archive import archivable_todos, archive_todos
+from . import async_views
+from .benchmarks import Scenario, cold_cache, deep_page, run_scenario, run_view_benchmarks, unbenchmarked_url_names, urlconf
+from .cache import get_cache, get_version
+from .counters import count_todos, get_counters
+from .exports import EXPORT_FIELDS
+from .forms import TodoForm
+from .imports import import_todos, read_rows
+from .management.commands.rebuildcounters import COUNTER_FIELDS
+from .middleware import ReplicaRoutingMiddleware
+from .models import ArchivedToDo, DailyStats, ShardOverride, ToDo, ToDoChange, TodoCounters
+from .pagination import Cursor, paginate_todos
+from .reminders import EmailReminderBackend, claim_batch, mark_sent, process_batch
+from .routers import LAST_WRITE_KEY, ReplicaRouter, use_replica
+from .search import install_search, reinstall_search, search_todos, uninstall_search
+from .seeding import seed_todos
+from .sharding import ShardRouter, on_shard, on_user_shard, shard_for, stable_shard
+from .staticfiles import StaticFilesMiddleware
+from .stats import backfill_stats, count_days
+from .sync import SETTLE_SECONDS, sync_batch
+from .throttling import count_attempt, window_keys
+from .views import MAX_BULK_TODOS
+
+
+class ViewBenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_todos(1, 120, prefix='bench', seed=1)[0]
+
+    def test_every_view_has_a_benchmark(self):
+        self.assertEqual(unbenchmarked_url_names(), set())
+
+    def test_views_stay_within_query_budget(self):
+        for result in run_view_benchmarks(self.user, repeat=2):
+            with self.subTest(result.scenario.label):
+                self.assertEqual(result.errors, [])
+                self.assertLessEqual(result.queries, result.scenario.budget)
+
+    def test_list_queries_do_not_grow_with_page_number(self):
+        first_page = run_scenario(Scenario('currenttodos', 5, prepare=cold_cache), self.user, repeat=2)
+        last_page = run_scenario(Scenario('currenttodos', 5, prepare=deep_page), self.user, repeat=2)
+        self.assertEqual(first_page.queries, last_page.queries)
+
+
+class MetricsTests(TestCase):
+    def test_requests_are_timed_and_exported(self):
+        response = self.client.get('/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('todo_requests_total{view="home",method="GET",status="2xx"}', metrics)
+        self.assertIn('todo_request_queries_bucket{view="home",le="+Inf"}', metrics)
+
+    def test_metrics_are_denied_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user('alice'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(TODO_METRICS_TOKEN='s3cret')
+    def test_token_grants_access(self):
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code, 200)
+
+
+@override_settings(TODO_LOGIN_THROTTLE={'username': (3, 60), 'ip': (5, 60)})
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        # Login attempts counted by other tests.
+        get_cache().clear()
+        User.objects.create_user('alice', password='correct horse')
+
+    def test_failures_lock_out_the_username_before_authenticating(self):
+        for _ in range(3):
+            response = self.client.post('/login/', {'username': 'alice', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.post('/login/', {'username': 'alice', 'password': 'correct horse'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_unknown_and_known_usernames_fail_alike(self):
+        unknown = self.client.post('/login/', {'username': 'nobody', 'password': 'wrong'})
+        known = self.client.post('/login/', {'username': 'alice', 'password': 'wrong'})
+        self.assertEqual(unknown.context['error'], known.context['error'])
+
+    def test_client_ip_limit_spans_usernames(self):
+        for n in range(5):
+            self.client.post('/login/', {'username': f'user{n}', 'password': 'wrong'})
+        response = self.client.post('/login/', {'username': 'alice', 'password': 'correct horse'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_attempts_are_counted_before_authenticating(self):
+        request, now = RequestFactory().post('/login/'), time.time()
+        # Three attempts still checking their passwords use up the limit.
+        for _ in range(3):
+            self.assertIsNone(count_attempt(request, 'alice', now))
+        self.assertEqual(count_attempt(request, 'alice', now)[0], 'username')
+        self.assertEqual(count_attempt(request, 'Alice ', now)[0], 'username')
+        # Rejected attempts are taken back off.
+        self.assertEqual(get_cache().get(window_keys('username', 'alice', now)[1]), 3)
+
+    def test_successful_logins_are_not_counted_against_the_ip(self):
+        for n in range(4):
+            self.client.post('/login/', {'username': f'user{n}', 'password': 'wrong'})
+        response = self.client.post('/login/', {'username': 'alice', 'password': 'correct horse'})
+        self.assertRedirects(response, '/current/', fetch_redirect_response=False)
+        self.assertEqual(self.client.post('/login/', {'username': 'bob', 'password': 'wrong'}).status_code, 200)
+        self.assertEqual(self.client.post('/login/', {'username': 'bob', 'password': 'wrong'}).status_code, 429)
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['todo.auth.CachedModelBackend'],
+)
+class CachedSessionTests(TestCase):
+    def setUp(self):
+        # Login attempts counted by other tests.
+        get_cache().clear()
+        self.user = User.objects.create_user('alice', password='correct horse')
+        self.client.post('/login/', {'username': 'alice', 'password': 'correct horse'})
+        self.client.get('/current/')
+
+    def test_warm_list_page_runs_no_auth_queries(self):
+        # Only the counters lookup the ETag is built from.
+        with self.assertNumQueries(1):
+            self.client.get('/current/')
+
+    def test_user_edits_are_written_through(self):
+        self.user.first_name = 'Alice'
+        self.user.save()
+        self.assertEqual(self.client.get('/current/').wsgi_request.user.first_name, 'Alice')
+
+    def test_password_change_ends_other_sessions(self):
+        self.user.set_password('battery staple')
+        self.user.save()
+        self.assertFalse(self.client.get('/current/').wsgi_request.user.is_authenticated)
+
+
+class StaticPipelineTests(TestCase):
+    def test_hashed_assets_are_served_precompressed_and_immutable(self):
+        with tempfile.TemporaryDirectory() as static_root, override_settings(
+            STATIC_ROOT=static_root,
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'todo.staticfiles.CompressedManifestStaticFilesStorage'}},
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            middleware = StaticFilesMiddleware(lambda request: HttpResponse(status=404))
+            url = static('todo/css/style.css')
+
+            response = middleware(RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip, deflate'))
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertTrue(gzip.decompress(b''.join(response.streaming_content)).startswith(b'.page-background'))
+
+            response = middleware(RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip;q=0'))
+            self.assertNotIn('Content-Encoding', response)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.todo = ToDo.objects.create(user=self.user, title='Water plants')
+        self.client.force_login(self.user)
+
+    def test_unchanged_list_is_not_modified_until_a_todo_changes(self):
+        etag = self.client.get('/current/')['ETag']
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get('/current/', headers={'If-None-Match': etag}).status_code, 304)
+
+        ToDo.objects.filter(pk=self.todo.pk).update_tracked(important=True)
+        self.assertEqual(self.client.get('/current/', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_edited_todo_is_modified(self):
+        url = f'/todo/{self.todo.pk}'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        self.client.post(url, {'title': 'Water the plants'})
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+
+class ArchiveTests(TestCase):
+    def test_archived_todos_are_listed_after_hot_ones(self):
+        user = User.objects.create_user('alice')
+        old, recent = ToDo.objects.create_tracked([
+            ToDo(user=user, title='Old', done=True),
+            ToDo(user=user, title='Recent', done=True),
+        ])
+        ToDo.objects.filter(pk=old.pk).update(updated_at=timezone.now() - timedelta(days=100))
+        self.client.force_login(user)
+        self.client.get('/completed/')
+
+        self.assertEqual(archive_todos(timedelta(days=90)), 1)
+        self.assertEqual(list(ArchivedToDo.objects.values_list('pk', flat=True)), [old.pk])
+        self.assertFalse(ToDo.objects.filter(pk=old.pk).exists())
+        self.assertEqual(TodoCounters.objects.get(user=user).completed_count, 2)
+
+        html = self.client.get('/completed/').content.decode()
+        self.assertLess(html.index('Recent'), html.index('Old'))
+
+    def test_batches_invalidate_lists_once_committed(self):
+        user = User.objects.create_user('alice')
+        old = ToDo.objects.create(user=user, title='Old', done=True)
+        ToDo.objects.filter(pk=old.pk).update(updated_at=timezone.now() - timedelta(days=100))
+        version = get_version(user.pk)
+
+        with self.captureOnCommitCallbacks(using=router.db_for_write(ToDo)) as callbacks:
+            self.assertEqual(archive_todos(timedelta(days=90)), 1)
+            self.assertEqual(get_version(user.pk), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(user.pk), version)
+
+    @skipUnless(connection.vendor == 'sqlite', "Other databases may prefer a full scan of a tiny table")
+    def test_cutoff_scan_uses_the_index(self):
+        plan = archivable_todos(timezone.now()).order_by('updated_at', 'id').explain()
+        self.assertIn('todo_done_updated_idx', plan)
+
+
+class DailyStatsTests(TestCase):
+    def test_rollups_follow_changes_and_match_a_backfill(self):
+        user = User.objects.create_user('alice')
+        todos = ToDo.objects.create_tracked([ToDo(user=user, title=f'Task {n}') for n in range(5)])
+        ToDo.objects.filter(pk__in=[todo.pk for todo in todos[:3]]).update_tracked(done=True)
+        ToDo.objects.filter(pk=todos[0].pk).update_tracked(done=False)
+        todos[4].delete()
+
+        today = DailyStats.objects.get(user=user, day=timezone.localdate())
+        self.assertEqual((today.created, today.completed), (4, 2))
+        self.assertEqual(count_days(user.pk), {today.day: {'created': 4, 'completed': 2, 'completed_late': 0}})
+
+        backfill_stats(user.pk)
+        self.assertEqual(DailyStats.objects.get(user=user).completed, 2)
+
+
+@override_settings(TODO_READ_REPLICAS=['replica_0'])
+class ReplicaRoutingTests(TestCase):
+    def read_db(self, method, path, user_id=None):
+        """
+        The database a read in the view serving ``path`` would use.
+        """
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            return HttpResponse(ReplicaRouter().db_for_read(ToDo))
+
+        middleware = ReplicaRoutingMiddleware(view)
+        request = getattr(RequestFactory(), method)(path)
+        request.resolver_match = resolve(path)
+        request.session = {SESSION_KEY: str(user_id)} if user_id else {}
+        return middleware(request).content.decode()
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        self.assertEqual(self.read_db('get', '/current/', user_id=1), 'replica_0')
+        self.assertEqual(self.read_db('get', '/admin/todo/todo/'), 'replica_0')
+        self.assertEqual(self.read_db('get', '/create/', user_id=1), 'default')
+
+        self.read_db('post', '/todo/1/complete', user_id=1)
+        self.assertEqual(self.read_db('get', '/todo/1', user_id=1), 'default')
+        self.assertEqual(self.read_db('get', '/todo/1', user_id=2), 'replica_0')
+        self.assertEqual(ReplicaRouter().db_for_read(ToDo), 'default')
+
+
+def own_test_database(alias):
+    # Configured shards and replicas mirror the default database in tests.
+    return alias in settings.DATABASES and not settings.DATABASES[alias].get('TEST', {}).get('MIRROR')
+
+
+@skipUnless(own_test_database('replica_0'), 'replica_0 shares the default test database')
+@override_settings(TODO_READ_REPLICAS=['replica_0'])
+class ReplicaDatabaseTests(TestCase):
+    databases = {'default', 'replica_0'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+
+    def replicate(self):
+        # The replica catches up: a copy of the primary.
+        for model in (User, Session, ToDo, TodoCounters):
+            model.objects.using('replica_0').all()._raw_delete('replica_0')
+            model.objects.using('replica_0').bulk_create(model.objects.using('default').all())
+
+    def test_users_read_their_own_writes(self):
+        bob = User.objects.create_user('bob')
+        with self.captureOnCommitCallbacks(execute=True):
+            ToDo.objects.create_tracked([ToDo(user=self.user, title='Alice task'), ToDo(user=bob, title='Bob task')])
+        bob_client = Client()
+        bob_client.force_login(bob)
+        self.client.force_login(self.user)
+        self.replicate()
+        # Long enough ago for the replica to have it all.
+        get_cache().delete_many([LAST_WRITE_KEY.format(user_id=user_id) for user_id in (self.user.pk, bob.pk)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/create/', {'title': 'Just added'})
+        self.assertNotIn('Just added', ToDo.objects.using('replica_0').values_list('title', flat=True))
+        self.assertContains(self.client.get('/current/'), 'Just added')
+
+        # Bob wrote nothing: he reads from the replica, even what the primary has changed since.
+        ToDo.objects.filter(user=bob).update(title='Bob task, renamed')
+        response = bob_client.get('/current/')
+        self.assertContains(response, 'Bob task')
+        self.assertNotContains(response, 'renamed')
+
+        # Once the write is no longer recent, Alice is back on the (lagging) replica.
+        get_cache().delete(LAST_WRITE_KEY.format(user_id=self.user.pk))
+        self.assertNotContains(self.client.get('/current/'), 'Just added')
+
+    def test_lists_stay_fresh_after_someone_else_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            todo = ToDo.objects.create(user=self.user, title='First title')
+        get_counters(self.user)
+        self.client.force_login(self.user)
+        self.replicate()
+        self.assertContains(self.client.get('/current/'), 'First title')
+
+        # Renamed by an admin: the user reads from the primary while the replica lags.
+        with self.captureOnCommitCallbacks(execute=True):
+            ToDo.objects.filter(pk=todo.pk).update_tracked(title='Second title')
+        self.assertContains(self.client.get('/current/'), 'Second title')
+
+        # A request that got to the lagging replica anyway doesn't cache its page as current.
+        with self.captureOnCommitCallbacks(execute=True):
+            ToDo.objects.filter(pk=todo.pk).update_tracked(title='Third title')
+        get_cache().delete(LAST_WRITE_KEY.format(user_id=self.user.pk))
+        self.assertContains(self.client.get('/current/'), 'First title')
+        self.replicate()
+        self.assertContains(self.client.get('/current/'), 'Third title')
+
+    def test_overdue_recount_is_read_back_from_the_primary(self):
+        now = timezone.now()
+        ToDo.objects.create(user=self.user, title='Late', deadline_datetime=now - timedelta(hours=1))
+        counters = TodoCounters.objects.create(
+            user=self.user, open_count=1, next_deadline=now - timedelta(hours=1), overdue_as_of=now - timedelta(hours=2),
+        )
+        # Replicated, overdue recount pending.
+        TodoCounters.objects.using('replica_0').bulk_create([counters])
+
+        token = use_replica.set(True)
+        try:
+            counters = get_counters(self.user)
+        finally:
+            use_replica.reset(token)
+        self.assertEqual(counters.overdue_count, 1)
+
+
+class TodoActionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.todos = ToDo.objects.create_tracked([ToDo(user=self.user, title=f'Task {n}') for n in range(2)])
+        self.client.force_login(self.user)
+
+    def test_json_clients_get_the_change_and_new_counts(self):
+        response = self.client.post(f'/todo/{self.todos[0].pk}/complete', headers={'Accept': 'application/json'})
+        self.assertEqual(response.json(), {
+            'id': self.todos[0].pk, 'done': True, 'counts': {'open': 1, 'completed': 1, 'overdue': 0},
+        })
+
+        response = self.client.post(f'/todo/{self.todos[1].pk}/delete', headers={'Accept': 'application/json'})
+        self.assertEqual(response.json()['counts'], {'open': 0, 'completed': 1, 'overdue': 0})
+
+    def test_browsers_are_redirected_to_the_list(self):
+        response = self.client.post(f'/todo/{self.todos[0].pk}/uncomplete', headers={'Accept': 'text/html,*/*;q=0.8'})
+        self.assertRedirects(response, '/current/')
+
+
+class ToDoAdminTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.todos = ToDo.objects.create_tracked([ToDo(user=self.owner, title=f'Task {n}') for n in range(3)])
+        get_counters(self.owner)
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+    def test_changelist_filters(self):
+        response = self.client.get('/admin/todo/todo/', {'done__exact': '0', 'important__exact': '0', 'deadline': 'none'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_actions_update_counters(self):
+        ids = [todo.pk for todo in self.todos]
+        self.client.post('/admin/todo/todo/', {'action': 'mark_done', '_selected_action': ids[:2]})
+        self.client.post('/admin/todo/todo/', {'action': 'delete_todos', '_selected_action': ids[2:]})
+
+        counters = TodoCounters.objects.get(user=self.owner)
+        self.assertEqual((counters.open_count, counters.completed_count), (0, 2))
+        self.assertEqual(ToDo.objects.filter(done=True).count(), 2)
+
+    def test_reopening_rearms_reminders(self):
+        ids = [todo.pk for todo in self.todos]
+        ToDo.objects.filter(pk__in=ids).update(done=True, reminder_sent_at=timezone.now())
+        self.client.post('/admin/todo/todo/', {'action': 'mark_not_done', '_selected_action': ids})
+        self.assertFalse(ToDo.objects.filter(pk__in=ids, reminder_sent_at__isnull=False).exists())
+
+
+class AccountDeletionTests(TestCase):
+    def test_deleted_account_is_closed_then_purged_in_batches(self):
+        user = User.objects.create_user('alice')
+        ToDo.objects.create_tracked([ToDo(user=user, title=f'Task {n}', done=n % 2) for n in range(5)])
+        self.client.force_login(user)
+
+        self.assertRedirects(self.client.post('/account/delete/'), '/')
+        user.refresh_from_db()
+        self.assertFalse(user.is_active)
+        self.assertFalse(self.client.get('/current/').wsgi_request.user.is_authenticated)
+
+        out = io.StringIO()
+        call_command('purgeaccounts', batch_size=2, stdout=out)
+        self.assertIn('deleted 4 row(s) so far', out.getvalue())
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+        self.assertFalse(ToDo.objects.exists())
+        self.assertFalse(DailyStats.objects.exists())
+
+
+@override_settings(TODO_SHARDS=['default', 'shard_1', 'shard_2'])
+class ShardRoutingTests(TestCase):
+    def test_users_are_spread_by_hash_unless_pinned(self):
+        self.assertEqual({stable_shard(user_id) for user_id in range(1, 100)}, {'default', 'shard_1', 'shard_2'})
+        self.assertEqual(stable_shard(42), stable_shard('42'))
+
+        router = ShardRouter()
+        user = User.objects.create_user('alice')
+        other = next(alias for alias in ('default', 'shard_1', 'shard_2') if alias != stable_shard(user.pk))
+        self.assertEqual(router.db_for_write(ToDo, instance=ToDo(user=user)), stable_shard(user.pk))
+        ShardOverride.objects.create(user=user, shard=other)
+        self.assertEqual(router.db_for_read(ToDo, instance=user), other)
+
+        # Users stay on the default database; unhinted queries go where pinned.
+        self.assertIsNone(router.db_for_read(User, instance=ToDo(user=user)))
+        with on_shard('shard_2'):
+            self.assertEqual(router.db_for_read(DailyStats), 'shard_2')
+
+    def test_export_reads_from_the_users_shard(self):
+        user = User.objects.create_user('alice')
+        ShardOverride.objects.create(user=user, shard='shard_1')
+        self.client.force_login(user)
+
+        # The rows are streamed after the request has left the shard middleware.
+        with mock.patch('todo.views.iter_export', return_value=iter(())) as iter_export:
+            self.client.get('/export/')
+        self.assertEqual(iter_export.call_args.args[0].db, 'shard_1')
+
+
+@skipUnless(own_test_database('shard_1'), 'shard_1 shares the default test database')
+@override_settings(TODO_SHARDS=['default', 'shard_1'])
+class ShardedDataTests(TestCase):
+    databases = {'default', 'shard_1'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        ShardOverride.objects.create(user=self.user, shard='shard_1')
+        with on_user_shard(self.user.pk):
+            ToDo.objects.create_tracked([ToDo(user=self.user, title=f'Task {n}', done=n % 2) for n in range(3)])
+            get_counters(self.user)
+            now = timezone.now()
+            ArchivedToDo.objects.create(
+                id=1000, user=self.user, title='Archived', creation_date=now, updated_at=now, completed_at=now,
+            )
+
+    def assertPurged(self):
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        for model in PURGED_MODELS:
+            self.assertFalse(model.objects.using('shard_1').filter(user_id=self.user.pk).exists(), model)
+
+    def sync(self, cursor):
+        for alias in self.databases:
+            ToDoChange.objects.using(alias).update(changed_at=F('changed_at') - timedelta(seconds=SETTLE_SECONDS))
+        return self.client.get('/sync/', {'cursor': cursor}).json()
+
+    def test_deleting_a_user_purges_their_shard(self):
+        for model in PURGED_MODELS:
+            self.assertTrue(model.objects.using('shard_1').filter(user_id=self.user.pk).exists(), model)
+        self.user.delete()
+        self.assertPurged()
+
+    def test_moving_a_user_keeps_their_data_and_resets_sync(self):
+        self.client.force_login(self.user)
+        cursor = self.sync('')['cursor']
+        stats = list(DailyStats.objects.using('shard_1').values_list('day', 'created', 'completed', 'completed_late'))
+
+        out = io.StringIO()
+        call_command('rebalanceshards', 'alice', to='default', batch_size=2, stdout=out)
+        self.assertIn('alice is on default (', out.getvalue())
+        self.assertEqual(shard_for(self.user.pk), 'default')
+        for model in PURGED_MODELS:
+            self.assertFalse(model.objects.using('shard_1').filter(user_id=self.user.pk).exists(), model)
+
+        moved = ToDo.objects.using('default').filter(user=self.user)
+        self.assertEqual(
+            sorted(moved.values_list('title', 'done')),
+            [('Archived', True), ('Task 0', False), ('Task 1', True), ('Task 2', False)],
+        )
+        self.assertEqual(list(DailyStats.objects.using('default').values_list('day', 'created', 'completed', 'completed_late')), stats)
+        counters = get_counters(self.user)
+        self.assertEqual((counters.open_count, counters.completed_count), (2, 2))
+
+        # The old cursor points at the old shard: the client starts over.
+        batch = self.sync(cursor)
+        self.assertTrue(batch['reset'])
+        self.assertEqual({change['id'] for change in batch['changes']}, set(moved.values_list('pk', flat=True)))
+        self.assertContains(self.client.get('/current/'), 'Task 2')
+
+        # Back on the first shard, the old cursor runs into the RESET change.
+        call_command('rebalanceshards', 'alice', to='shard_1', stdout=io.StringIO())
+        batch = self.sync(cursor)
+        self.assertTrue(batch['reset'])
+        self.assertEqual(len(batch['changes']), 4)
+
+    def test_admin_deletion_purges_the_users_shard(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.post(f'/admin/auth/user/{self.user.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertPurged()
+
+
+class SyncTests(TestCase):
+    def sync(self, cursor=''):
+        # Cursors only move past settled changes.
+        ToDoChange.objects.update(changed_at=F('changed_at') - timedelta(seconds=SETTLE_SECONDS))
+        response = self.client.get('/sync/', {'cursor': cursor, 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_sync_returns_changes_and_tombstones_since_the_cursor(self):
+        user = User.objects.create_user('alice')
+        kept, edited, deleted, archived = ToDo.objects.create_tracked([
+            ToDo(user=user, title=title, done=title == 'Archived') for title in ('Kept', 'Edited', 'Deleted', 'Archived')
+        ])
+        self.client.force_login(user)
+
+        first = self.sync()
+        self.assertTrue(first['has_more'])
+        second = self.sync(first['cursor'])
+        self.assertEqual([change['title'] for change in first['changes'] + second['changes']],
+                         ['Kept', 'Edited', 'Deleted', 'Archived'])
+        cursor = second['cursor']
+        self.assertEqual(self.sync(cursor)['changes'], [])
+
+        edited.title = 'Renamed'
+        edited.save()
+        ToDo.objects.filter(pk=deleted.pk).delete_tracked()
+        ToDo.objects.filter(pk=archived.pk).update(updated_at=timezone.now() - timedelta(days=100))
+        archive_todos(timedelta(days=90))
+        changes = self.sync(cursor)['changes']
+        self.assertEqual([(change['id'], change['deleted']) for change in changes], [(edited.pk, False), (deleted.pk, True)])
+        self.assertEqual(changes[0]['title'], 'Renamed')
+        self.assertEqual(ToDoChange.objects.count(), 4)
+
+        # Nothing new: one lookup on the change index.
+        cursor = self.sync(cursor)['cursor']
+        with self.assertNumQueries(1):
+            batch = sync_batch(user, cursor)
+        self.assertEqual((batch['changes'], batch['cursor']), ([], cursor))
+
+        self.assertEqual(self.client.get('/sync/', {'cursor': 'nope'}).status_code, 400)
+
+    def test_handing_a_todo_over_leaves_a_tombstone_for_the_old_owner(self):
+        alice, bob = User.objects.create_user('alice'), User.objects.create_user('bob')
+        todo = ToDo.objects.create(user=alice, title='Shared')
+        self.client.force_login(alice)
+        cursor = self.sync()['cursor']
+
+        todo.user = bob
+        todo.save()
+        self.assertEqual(self.sync(cursor)['changes'], [{'id': todo.pk, 'deleted': True}])
+        self.client.force_login(bob)
+        self.assertEqual([(change['id'], change['deleted']) for change in self.sync()['changes']], [(todo.pk, False)])
+
+
+class RecurrenceTests(TestCase):
+    def test_completing_a_repeating_todo_creates_only_the_next_occurrence(self):
+        user = User.objects.create_user('alice')
+        # Three weeks overdue: the missed occurrences are skipped.
+        deadline = timezone.now() - timedelta(weeks=3, hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            todo = ToDo.objects.create(user=user, title='Weekly review', deadline_datetime=deadline, recurrence='weekly')
+        self.client.force_login(user)
+
+        html = self.client.get('/current/').content.decode()
+        self.assertIn('Weekly:', html)
+        self.assertIn(f'then {todo.upcoming_occurrences()[0]:%b %d}', html)
+
+        response = self.client.post(f'/todo/{todo.pk}/complete', headers={'Accept': 'application/json'})
+        self.assertTrue(response.json()['repeats'])
+        self.assertEqual(response.json()['counts']['open'], 1)
+        next_todo = ToDo.objects.get(done=False)
+        self.assertEqual((next_todo.title, next_todo.recurrence), ('Weekly review', 'weekly'))
+        self.assertEqual(next_todo.deadline_datetime, deadline + timedelta(weeks=4))
+        self.assertEqual(ToDo.objects.get(pk=todo.pk).recurrence, '')
+
+        # Undoing and redoing the old one doesn't repeat it again.
+        self.client.post(f'/todo/{todo.pk}/uncomplete')
+        self.client.post(f'/todo/{todo.pk}/complete')
+        self.assertEqual(ToDo.objects.count(), 2)
+
+        form = TodoForm(data={'title': 'Daily', 'recurrence': 'daily'})
+        self.assertIn('recurrence', form.errors)
+
+    def test_reopening_takes_the_next_occurrence_back(self):
+        user = User.objects.create_user('alice')
+        deadline = timezone.now() + timedelta(hours=1)
+        todo = ToDo.objects.create(user=user, title='Standup', deadline_datetime=deadline, recurrence='daily')
+        self.client.force_login(user)
+
+        self.client.post(f'/todo/{todo.pk}/complete')
+        self.client.post(f'/todo/{todo.pk}/uncomplete')
+        self.assertEqual(list(ToDo.objects.values_list('pk', 'done', 'recurrence')), [(todo.pk, False, 'daily')])
+
+        # The bulk "mark pending" too, and completing again repeats again.
+        self.client.post('/bulk/', {'action': 'complete', 'ids': [todo.pk]})
+        self.client.post('/bulk/', {'action': 'uncomplete', 'ids': [todo.pk], 'next': 'completedtodos'})
+        self.assertEqual(ToDo.objects.count(), 1)
+        self.client.post(f'/todo/{todo.pk}/complete')
+        next_todo = ToDo.objects.get(done=False)
+        self.assertEqual(next_todo.deadline_datetime, deadline + timedelta(days=1))
+
+        # Once the next one is done as well, it carries the series on.
+        self.client.post(f'/todo/{next_todo.pk}/complete')
+        self.client.post(f'/todo/{todo.pk}/uncomplete')
+        self.assertEqual(
+            sorted(ToDo.objects.values_list('deadline_datetime', 'done', 'recurrence')),
+            [(deadline, False, ''), (deadline + timedelta(days=1), True, ''), (deadline + timedelta(days=2), False, 'daily')],
+        )
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        now = timezone.now().replace(microsecond=0)
+        # Duplicate deadlines and undated rows on both sides of the dated ones.
+        deadlines = [None, now, now + timedelta(days=1), None, now, now - timedelta(days=1), now, None, now + timedelta(days=1)]
+        self.todos = ToDo.objects.create_tracked([
+            ToDo(user=self.user, title=f'Task {n}', done=True, deadline_datetime=deadline)
+            for n, deadline in enumerate(deadlines)
+        ])
+        ArchivedToDo.objects.bulk_create([
+            ArchivedToDo(id=1000 + n, user=self.user, title=f'Archived {n}', creation_date=now, updated_at=now,
+                         deadline_datetime=deadline)
+            for n, deadline in enumerate([None, now, now, None, now - timedelta(days=2)])
+        ])
+
+    def expected(self, rows):
+        dated = sorted((row for row in rows if row.deadline_datetime), key=lambda row: (row.deadline_datetime, row.pk))
+        undated = sorted((row for row in rows if not row.deadline_datetime), key=lambda row: row.pk)
+        return [row.pk for row in dated[::-1] + undated[::-1]]
+
+    def page(self, **params):
+        request = RequestFactory().get('/completed/', params)
+        return paginate_todos(ToDo.objects.filter(user=self.user), request, archive=ArchivedToDo.objects.filter(user=self.user))
+
+    def test_cursor_pages_walk_forward_and_back_in_keyset_order(self):
+        expected = self.expected(self.todos) + self.expected(ArchivedToDo.objects.all())
+
+        pages = [self.page()]
+        while pages[-1].has_next():
+            pages.append(self.page(after=pages[-1].next_cursor()))
+        self.assertEqual([todo.pk for page in pages for todo in page], expected)
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4])
+        self.assertEqual(pages[2].start_index(), 9)
+
+        walked_back = [pages[-1]]
+        while walked_back[-1].has_previous():
+            walked_back.append(self.page(before=walked_back[-1].previous_cursor()))
+        self.assertEqual([[todo.pk for todo in page] for page in walked_back[::-1]],
+                         [[todo.pk for todo in page] for page in pages])
+
+    def test_invalid_and_stale_cursors_fall_back_to_the_first_page(self):
+        first = [todo.pk for todo in self.page()]
+        self.assertEqual([todo.pk for todo in self.page(after='not-a-cursor')], first)
+
+        past_the_end = Cursor(None, 1, 5, archived=True).encode()
+        page = self.page(after=past_the_end)
+        self.assertEqual([todo.pk for todo in page], first)
+        self.assertFalse(page.has_previous())
+
+    @override_settings(TODO_PAGINATION='offset')
+    def test_offset_pages_follow_the_same_order(self):
+        expected = self.expected(self.todos) + self.expected(ArchivedToDo.objects.all())
+        rows = [todo.pk for number in range(1, 5) for todo in self.page(page=number)]
+        self.assertEqual(rows, expected)
+        self.assertEqual(self.page(page=99).number, 4)
+        self.assertEqual(self.page(page='x').number, 1)
+
+
+class CounterTests(TestCase):
+    def assertCountersMatch(self, user):
+        counters = get_counters(user)
+        actual = count_todos(user.pk, counters.overdue_as_of)
+        self.assertEqual({field: getattr(counters, field) for field in COUNTER_FIELDS},
+                         {field: actual[field] for field in COUNTER_FIELDS})
+
+    def test_counters_follow_every_kind_of_change(self):
+        user = User.objects.create_user('alice')
+        now = timezone.now()
+        get_counters(user)
+
+        overdue = ToDo.objects.create(user=user, title='Overdue', deadline_datetime=now - timedelta(days=1), important=True)
+        upcoming = ToDo.objects.create(user=user, title='Upcoming', deadline_datetime=now + timedelta(days=1))
+        self.assertCountersMatch(user)
+
+        overdue.done = True
+        overdue.save()
+        self.assertCountersMatch(user)
+        overdue.done = False
+        overdue.save()
+        self.assertCountersMatch(user)
+
+        upcoming.deadline_datetime = now - timedelta(hours=1)
+        upcoming.save()
+        overdue.deadline_datetime = now + timedelta(days=2)
+        overdue.save()
+        self.assertCountersMatch(user)
+
+        bulk = ToDo.objects.create_tracked([ToDo(user=user, title=f'Bulk {n}', done=n % 2) for n in range(4)])
+        ToDo.objects.filter(pk__in=[todo.pk for todo in bulk]).update_tracked(important=True, done=True)
+        self.assertCountersMatch(user)
+        ToDo.objects.filter(pk__in=[todo.pk for todo in bulk[:2]]).update_tracked(done=False)
+        self.assertCountersMatch(user)
+
+        # Once the next deadline passes, overdue todos are recounted.
+        with mock.patch('todo.counters.timezone.now', return_value=now + timedelta(days=3)):
+            self.assertEqual(get_counters(user).overdue_count, 2)
+            self.assertCountersMatch(user)
+
+        ToDo.objects.filter(pk__in=[todo.pk for todo in bulk]).delete_tracked()
+        upcoming.delete()
+        self.assertCountersMatch(user)
+
+    def test_verify_reports_counters_that_drifted(self):
+        user = User.objects.create_user('alice')
+        ToDo.objects.create(user=user, title='Task')
+        get_counters(user)
+
+        out = io.StringIO()
+        call_command('rebuildcounters', verify=True, stdout=out)
+        self.assertIn('All counters match', out.getvalue())
+
+        TodoCounters.objects.filter(user=user).update(open_count=5)
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuildcounters', verify=True, stdout=out)
+        self.assertIn('alice: open_count=5 (actual 1)', out.getvalue())
+
+        call_command('rebuildcounters', user='alice', stdout=io.StringIO())
+        self.assertEqual(TodoCounters.objects.get(user=user).open_count, 1)
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.todos = ToDo.objects.create_tracked([ToDo(user=self.user, title=f'Task {n}') for n in range(3)])
+        self.ids = [todo.pk for todo in self.todos]
+        self.client.force_login(self.user)
+
+    def bulk(self, action, ids):
+        return self.client.post('/bulk/', {'action': action, 'ids': ids}, headers={'Accept': 'application/json'})
+
+    def test_each_action_applies_to_the_users_own_todos(self):
+        other = ToDo.objects.create(user=User.objects.create_user('bob'), title='Not yours')
+
+        self.assertEqual(self.bulk('complete', self.ids + [other.pk]).json(), {'action': 'complete', 'count': 3})
+        self.assertFalse(ToDo.objects.get(pk=other.pk).done)
+        self.assertEqual(self.bulk('uncomplete', self.ids[:2]).json()['count'], 2)
+        self.assertEqual(self.bulk('important', self.ids).json()['count'], 3)
+        self.assertEqual(list(ToDo.objects.filter(user=self.user).values_list('done', 'important').order_by('pk')),
+                         [(False, True), (False, True), (True, True)])
+        self.assertEqual(self.bulk('delete', self.ids + [other.pk]).json()['count'], 3)
+        self.assertEqual(list(ToDo.objects.values_list('pk', flat=True)), [other.pk])
+
+        response = self.client.post('/bulk/', {'action': 'complete', 'ids': self.ids, 'next': 'completedtodos'})
+        self.assertRedirects(response, '/completed/', fetch_redirect_response=False)
+
+    def test_bad_requests_are_rejected(self):
+        self.assertEqual(self.bulk('archive', self.ids).status_code, 400)
+        self.assertEqual(self.bulk('complete', ['one']).status_code, 400)
+        self.assertEqual(self.bulk('complete', list(range(1, MAX_BULK_TODOS + 2))).status_code, 400)
+        self.assertFalse(ToDo.objects.filter(done=True).exists())
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+
+    def test_bad_rows_are_reported_without_aborting_the_file(self):
+        data = (
+            'title,important,done\n'
+            'First,true,false\n'
+            f'"{"x" * 200_000}",true,false\n'
+            ',false,false\n'
+            'Second,maybe,false\n'
+            'Third,false,true\n'
+        )
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('todos.csv', data.encode())
+        result = self.client.post('/import/', {'file': upload, 'format': 'csv'}).context['result']
+
+        self.assertEqual((result.created, result.failed), (2, 3))
+        self.assertEqual([line for line, message in result.errors], [3, 4, 5])
+        self.assertIn('field larger than field limit', result.errors[0][1])
+        self.assertEqual(list(ToDo.objects.order_by('pk').values_list('title', 'important', 'done')),
+                         [('First', True, False), ('Third', False, True)])
+
+    def test_rows_are_written_in_batches(self):
+        rows = read_rows(io.StringIO('{"title": "A"}\nnot json\n{"title": "B"}\n[1]\n{"title": "C"}\n'), 'ndjson')
+        with mock.patch.object(ToDo.objects, 'create_tracked', wraps=ToDo.objects.create_tracked) as create_tracked:
+            result = import_todos(self.user, rows, batch_size=2)
+        self.assertEqual([len(call.args[0]) for call in create_tracked.call_args_list], [2, 1])
+        self.assertEqual((result.created, result.errors), (3, [(2, 'Invalid JSON'), (4, 'Expected a JSON object')]))
+
+    def test_exported_files_import_unchanged(self):
+        deadline = timezone.now().replace(microsecond=123456) + timedelta(days=3)
+        bob = User.objects.create_user('bob')
+        ToDo.objects.create_tracked([
+            ToDo(user=bob, title='Weekly, "quoted"', description='Line one\nline two', important=True,
+                 deadline_datetime=deadline, recurrence='weekly'),
+            ToDo(user=bob, title='Done', done=True),
+        ])
+        fields = ('title', 'description', 'important', 'done', 'deadline_datetime', 'recurrence')
+        exported = list(ToDo.objects.order_by('pk').values_list(*fields))
+
+        self.client.force_login(bob)
+        for export_format in ('csv', 'ndjson'):
+            ToDo.objects.filter(user=self.user).delete_tracked()
+            data = b''.join(self.client.get('/export/', {'format': export_format}).streaming_content).decode()
+            result = import_todos(self.user, read_rows(io.StringIO(data, newline=''), export_format))
+            self.assertEqual((result.created, result.errors), (2, []))
+            self.assertEqual(list(ToDo.objects.filter(user=self.user).order_by('pk').values_list(*fields)), exported)
+
+        result = import_todos(self.user, [(1, {'title': 'Soon', 'deadline_datetime': 'tomorrow'})])
+        self.assertEqual(result.errors, [(1, "deadline_datetime: Expected an ISO 8601 datetime, got 'tomorrow'")])
+
+    def test_command_reports_bad_lines(self):
+        out, err = io.StringIO(), io.StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write(f'title\nGood\n"{"x" * 200_000}"\n')
+            file.flush()
+            call_command('importtodos', 'alice', file.name, stdout=out, stderr=err)
+        self.assertIn('Imported 1 todo(s), skipped 1 row(s)', out.getvalue())
+        self.assertIn('Line 3: Invalid CSV', err.getvalue())
+
+
+class FragmentCacheTests(TestCase):
+    def test_bulk_changes_invalidate_the_cached_list_once_committed(self):
+        user = User.objects.create_user('alice')
+        with self.captureOnCommitCallbacks(execute=True):
+            todos = ToDo.objects.create_tracked([ToDo(user=user, title=f'Task {n}') for n in range(2)])
+        self.client.force_login(user)
+        self.assertContains(self.client.get('/current/'), 'Task 1')
+        version = get_version(user.pk)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            ToDo.objects.filter(pk__in=[todo.pk for todo in todos]).update_tracked(done=True)
+            # Until the commit, other requests still see (and cache) the old rows.
+            self.assertEqual(get_version(user.pk), version)
+        for callback in callbacks:
+            callback()
+
+        self.assertNotEqual(get_version(user.pk), version)
+        self.assertNotContains(self.client.get('/current/'), 'Task 1')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        response = self.client.get('/export/', params)
+        return b''.join(response.streaming_content).decode()
+
+    def test_archived_todos_are_exported_after_hot_ones(self):
+        old, recent = ToDo.objects.create_tracked([
+            ToDo(user=self.user, title='Old', done=True),
+            ToDo(user=self.user, title='Recent', done=True),
+        ])
+        ToDo.objects.filter(pk=old.pk).update(updated_at=timezone.now() - timedelta(days=100))
+        archive_todos(timedelta(days=90))
+
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([(row['id'], row['title'], row['done']) for row in rows], [(recent.pk, 'Recent', True), (old.pk, 'Old', True)])
+        self.assertEqual(self.export(done='false'), '')
+
+    def test_filters_and_formats(self):
+        now = timezone.now()
+        ToDo.objects.create_tracked([
+            ToDo(user=self.user, title='Due, important', important=True, deadline_datetime=now + timedelta(days=1)),
+            ToDo(user=self.user, title='Done, "quoted"', done=True),
+            ToDo(user=self.user, title='Overdue', deadline_datetime=now - timedelta(days=1)),
+        ])
+        ToDo.objects.create(user=User.objects.create_user('bob'), title='Not yours')
+
+        rows = list(csv.DictReader(io.StringIO(self.export(format='csv'))))
+        self.assertEqual(list(rows[0]), list(EXPORT_FIELDS))
+        self.assertEqual([row['title'] for row in rows], ['Due, important', 'Done, "quoted"', 'Overdue'])
+        self.assertEqual(rows[0]['deadline_datetime'], (now + timedelta(days=1)).isoformat())
+
+        def titles(**params):
+            return [json.loads(line)['title'] for line in self.export(**params).splitlines()]
+
+        self.assertEqual(titles(done='true'), ['Done, "quoted"'])
+        self.assertEqual(titles(important='yes', done='false'), ['Due, important'])
+        self.assertEqual(titles(deadline_before=now.isoformat()), ['Overdue'])
+        self.assertEqual(titles(deadline_after=now.replace(tzinfo=None).isoformat()), ['Due, important'])
+
+        self.assertEqual(self.client.get('/export/', {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/export/', {'done': 'maybe'}).status_code, 400)
+        response = self.client.get('/export/', {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="todos.csv"')
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', email='alice@example.com')
+        now = timezone.now()
+        self.todos = ToDo.objects.create_tracked([
+            ToDo(user=self.user, title=f'Task {n}', deadline_datetime=now + timedelta(minutes=n + 1)) for n in range(3)
+        ])
+        ToDo.objects.create(user=self.user, title='Later', deadline_datetime=now + timedelta(days=1))
+
+    def test_workers_claim_disjoint_batches_until_the_lease_expires(self):
+        first = claim_batch('a', 2)
+        self.assertEqual([todo.title for todo in first], ['Task 0', 'Task 1'])
+        self.assertEqual([todo.title for todo in claim_batch('b', 10)], ['Task 2'])
+        self.assertEqual(claim_batch('c', 10), [])
+
+        # Only the lease owner can mark its todos as sent.
+        self.assertEqual(mark_sent('b', [first[0].pk]), 0)
+        self.assertEqual(mark_sent('a', [first[0].pk]), 1)
+
+        expired = timezone.now() + timedelta(seconds=settings.TODO_REMINDER_LEASE + 1)
+        self.assertEqual([todo.title for todo in claim_batch('c', 10, now=expired)], ['Task 1', 'Task 2'])
+
+    def test_failed_deliveries_are_logged_and_retried(self):
+        backend = EmailReminderBackend()
+        with mock.patch.object(backend, 'send', side_effect=ConnectionError('mail server down')):
+            with self.assertLogs('todo.reminders', 'ERROR'):
+                self.assertEqual(process_batch('a', backend, 10), 3)
+        self.assertFalse(ToDo.objects.filter(reminder_sent_at__isnull=False).exists())
+
+        expired = timezone.now() + timedelta(seconds=settings.TODO_REMINDER_LEASE + 1)
+        with mock.patch('todo.reminders.timezone.now', return_value=expired):
+            self.assertEqual(process_batch('b', backend, 10), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(ToDo.objects.filter(reminder_sent_at__isnull=False).count(), 3)
+
+    def test_a_failed_reminder_is_retried_on_its_own(self):
+        send = EmailMessage.send
+
+        def bounce_task_1(message, fail_silently=False):
+            if 'Task 1' in message.subject:
+                raise ConnectionError('recipient refused')
+            return send(message, fail_silently)
+
+        backend = EmailReminderBackend()
+        with mock.patch.object(EmailMessage, 'send', autospec=True, side_effect=bounce_task_1):
+            with self.assertLogs('todo.reminders', 'ERROR'):
+                self.assertEqual(process_batch('a', backend, 10), 3)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(list(ToDo.objects.filter(reminder_sent_at__isnull=True, deadline_datetime__isnull=False)
+                              .order_by('pk').values_list('title', flat=True)), ['Task 1', 'Later'])
+        # Released, but not to be claimed again before the lease would have run out.
+        self.assertEqual(ToDo.objects.get(pk=self.todos[1].pk).reminder_lease_owner, '')
+        self.assertEqual(claim_batch('b', 10), [])
+
+        expired = timezone.now() + timedelta(seconds=settings.TODO_REMINDER_LEASE + 1)
+        with mock.patch('todo.reminders.timezone.now', return_value=expired):
+            self.assertEqual(process_batch('b', backend, 10), 1)
+        self.assertEqual([message.subject.split('"')[1] for message in mail.outbox], ['Task 0', 'Task 2', 'Task 1'])
+
+    def test_saving_leaves_leases_and_sent_reminders_alone(self):
+        todo = ToDo.objects.get(pk=self.todos[0].pk)
+        claim_batch('a', 10)
+        todo.title = 'Renamed'
+        todo.save()
+        self.assertEqual(mark_sent('a', [todo.pk]), 1)
+
+        # A stale copy saved after the reminder went out doesn't re-arm it.
+        todo.important = True
+        todo.save()
+        stored = ToDo.objects.get(pk=todo.pk)
+        self.assertEqual((stored.title, stored.important), ('Renamed', True))
+        self.assertIsNotNone(stored.reminder_sent_at)
+
+    def test_moved_deadlines_and_reopened_todos_are_reminded_again(self):
+        mark_sent('a', [todo.pk for todo in claim_batch('a', 10)])
+        moved, reopened = ToDo.objects.filter(pk__in=[self.todos[0].pk, self.todos[1].pk]).order_by('pk')
+        moved.deadline_datetime += timedelta(minutes=5)
+        moved.save()
+        reopened.done = True
+        reopened.save()
+        reopened.done = False
+        reopened.save()
+        self.assertEqual(list(ToDo.objects.filter(reminder_sent_at__isnull=True, deadline_datetime__isnull=False)
+                              .order_by('pk').values_list('title', flat=True)), ['Task 0', 'Task 1', 'Later'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+
+    def titles(self, query):
+        return [todo.title for todo in search_todos(self.user, query)]
+
+    def test_title_matches_rank_first_and_other_users_are_left_out(self):
+        ToDo.objects.create_tracked([
+            ToDo(user=self.user, title='Groceries', description='Call the shop about the order'),
+            ToDo(user=self.user, title='Call mom'),
+            ToDo(user=self.user, title='Unrelated'),
+        ])
+        ToDo.objects.create(user=User.objects.create_user('bob'), title='Call bob')
+
+        self.assertEqual(self.titles('call'), ['Call mom', 'Groceries'])
+        self.assertEqual(self.titles('cal'), ['Call mom', 'Groceries'])
+        self.assertEqual(self.titles('calling shop'), ['Groceries'])
+        self.assertEqual(self.titles('!!!'), [])
+
+        self.client.force_login(self.user)
+        html = self.client.get('/search/', {'q': 'call'}).content.decode()
+        self.assertIn('Call mom', html)
+        self.assertNotIn('Call bob', html)
+
+    def test_index_follows_saves_bulk_writes_and_deletes(self):
+        todo = ToDo.objects.create(user=self.user, title='Write report')
+        todo.title = 'Write summary'
+        todo.save()
+        self.assertEqual(self.titles('report'), [])
+        self.assertEqual(self.titles('summary'), ['Write summary'])
+
+        bulk = ToDo.objects.create_tracked([ToDo(user=self.user, title=f'Plan trip {n}') for n in range(2)])
+        ToDo.objects.filter(pk=bulk[0].pk).update(description='book flights')
+        self.assertEqual(self.titles('flights'), ['Plan trip 0'])
+        self.assertEqual(len(self.titles('trip')), 2)
+
+        ToDo.objects.filter(pk__in=[todo.pk for todo in bulk]).delete_tracked()
+        todo.delete()
+        self.assertEqual(self.titles('trip'), [])
+        self.assertEqual(self.titles('write'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite keeps the index in an FTS5 table')
+    def test_migrate_reinstalls_dropped_triggers(self):
+        uninstall_search(connection)
+        ToDo.objects.create(user=self.user, title='Indexed later')
+
+        reinstall_search(sender=apps.get_app_config('todo'), using='default', plan=[])
+        self.assertEqual(self.titles('later'), [])
+        ToDo.objects.create(user=self.user, title='Indexed now')
+        self.assertEqual(self.titles('indexed'), ['Indexed now'])
+
+        install_search(connection, rebuild=True)
+        self.assertEqual(self.titles('indexed'), ['Indexed now', 'Indexed later'])
+
+
+@override_settings(ROOT_URLCONF=urlconf(async_views))
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.first, cls.second = ToDo.objects.create_tracked([ToDo(user=cls.user, title=f'Task {n}') for n in range(2)])
+            cls.other = ToDo.objects.create(user=User.objects.create_user('bob'), title='Not yours')
+
+    async def test_list_detail_complete_and_delete(self):
+        await self.async_client.aforce_login(self.user)
+        json_headers = {'Accept': 'application/json'}
+
+        response = await self.async_client.get('/current/')
+        self.assertTrue(iscoroutinefunction(response.resolver_match.func))
+        self.assertContains(response, 'Task 1')
+        self.assertContains(await self.async_client.get(f'/todo/{self.first.pk}'), 'Task 0')
+        self.assertEqual((await self.async_client.get(f'/todo/{self.other.pk}')).status_code, 404)
+
+        response = await self.async_client.post(f'/todo/{self.first.pk}/complete', headers=json_headers)
+        self.assertEqual(response.json(), {'id': self.first.pk, 'done': True, 'counts': {'open': 1, 'completed': 1, 'overdue': 0}})
+        self.assertContains(await self.async_client.get('/completed/'), 'Task 0')
+
+        response = await self.async_client.post(f'/todo/{self.second.pk}/delete')
+        self.assertRedirects(response, '/current/', fetch_redirect_response=False)
+        self.assertFalse(await ToDo.objects.filter(pk=self.second.pk).aexists())
+        self.assertEqual((await self.async_client.post(f'/todo/{self.other.pk}/delete')).status_code, 404)
@@ -0,0 +1,107 @@
+"""
+Login throttling.
+
+Login attempts are counted per username and per client IP in the cache,
+with a sliding window approximated from two fixed windows: the previous
+window's count, weighted by how much of it still overlaps the sliding
+window, plus the current one's. Each attempt is counted (an atomic
+increment) before the limit is checked and before the user is looked up
+or a password hashed, so concurrent attempts can't all slip under the
+limit; rejected attempts and successful logins are taken back off.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+
+from .cache import get_cache, increment
+
+WINDOW_KEY = 'todo:throttle:{scope}:{digest}:{window}'
+STATS_KEYS = {
+    'failed': 'todo:stats:login:failed',
+    'rejected_username': 'todo:stats:login:rejected_username',
+    'rejected_ip': 'todo:stats:login:rejected_ip',
+}
+
+
+def client_ip(request):
+    # Behind a reverse proxy, TODO_CLIENT_IP_HEADER names the META key it
+    # puts the client address in (e.g. HTTP_X_REAL_IP).
+    header = settings.TODO_CLIENT_IP_HEADER
+    return (header and request.META.get(header)) or request.META.get('REMOTE_ADDR', '')
+
+
+def throttle_keys(request, username):
+    """
+    The (scope, identifier) pairs an attempt counts against.
+    """
+    return [('username', username.strip().lower()), ('ip', client_ip(request))]
+
+
+def window_keys(scope, identifier, now):
+    _, period = settings.TODO_LOGIN_THROTTLE[scope]
+    digest = hashlib.md5(identifier.encode(), usedforsecurity=False).hexdigest()
+    window, offset = divmod(now, period)
+    return (
+        WINDOW_KEY.format(scope=scope, digest=digest, window=int(window) - 1),
+        WINDOW_KEY.format(scope=scope, digest=digest, window=int(window)),
+        offset / period,
+    )
+
+
+def count_attempt(request, username, now=None):
+    """
+    Counts a login attempt against every limit and returns
+    ``(scope, retry_after_seconds)`` for the first one it is over, or None.
+    """
+    now = now or time.time()
+    cache = get_cache()
+    counted = []
+    for scope, identifier in throttle_keys(request, username):
+        _, period = settings.TODO_LOGIN_THROTTLE[scope]
+        previous_key, current_key, elapsed = window_keys(scope, identifier, now)
+        counted.append((scope, previous_key, current_key, elapsed, increment(current_key, timeout=2 * period)))
+
+    for scope, previous_key, current_key, elapsed, current in counted:
+        limit, period = settings.TODO_LOGIN_THROTTLE[scope]
+        previous = cache.get(previous_key, 0)
+        if previous * (1 - elapsed) + current > limit:
+            for _, _, key, _, _ in counted:
+                uncount(key)
+            increment(STATS_KEYS[f'rejected_{scope}'])
+            # Until enough of the previous window has slid out, or the next window starts.
+            current -= 1
+            if current < limit and previous:
+                retry_after = (1 - elapsed - (limit - current) / previous) * period
+            else:
+                retry_after = (1 - elapsed) * period
+            return scope, max(math.ceil(retry_after), 1)
+    return None
+
+
+def uncount(key):
+    try:
+        get_cache().decr(key)
+    except ValueError:
+        # Expired, or the window has moved on since.
+        pass
+
+
+def record_failure():
+    increment(STATS_KEYS['failed'])
+
+
+def record_success(request, username, now=None):
+    """
+    Forgets a username's attempts once its owner has logged in, and takes
+    this attempt back off the client IP's count.
+    """
+    now = now or time.time()
+    get_cache().delete_many(window_keys('username', username.strip().lower(), now)[:2])
+    uncount(window_keys('ip', client_ip(request), now)[1])
+
+
+def get_stats():
+    values = get_cache().get_many(STATS_KEYS.values())
+    return {outcome: values.get(key, 0) for outcome, key in STATS_KEYS.items()}
@@ -1,10 +1,30 @@
+import io
+import math
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.models import User
-from django.contrib.auth import login, logout, authenticate
-from .forms import TodoForm, CustomUserCreationForm, CustomAuthenticationForm
-from .models import ToDo
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.contrib.auth import login, logout
+from .accounts import schedule_deletion
+from .actions import action_response
+from .forms import TodoForm, CustomUserCreationForm, CustomAuthenticationForm, ImportForm
+from .models import ArchivedToDo, ToDo
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.views.decorators.http import require_POST
+from .cache import cached_fragment
+from .conditional import list_validators, not_modified, todo_validators, with_validators
+from .counters import get_counters
+from .exports import EXPORT_FORMATS, exported_archive, iter_export, parse_filters
+from .imports import import_todos, read_rows
+from .metrics import render_metrics
+from .pagination import paginate_todos
+from .search import search_todos
+from .sharding import shard_for
+from .stats import dashboard_stats
+from .sync import SYNC_BATCH_SIZE, SYNC_MAX_BATCH_SIZE, sync_batch
+from .throttling import count_attempt, record_failure, record_success
 
 def home(request):
     return render(request, 'todo/home.html')
@@ -39,21 +59,28 @@ def loginuser(request):
     if request.method == "GET":
         return render(request, 'todo/loginuser.html', {"form": CustomAuthenticationForm()})
     else:
-        username = request.POST["username"]
-        password = request.POST["password"]
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            return render(request, "todo/loginuser.html",
-                          {"form": CustomAuthenticationForm(), "error":"User does not exist"})
-        else:
-            user = authenticate(request, username=username, password=password)
-
-        if user is None:
+        username = request.POST.get("username", "")
+        limited = count_attempt(request, username)
+        if limited:
+            scope, retry_after = limited
+            response = render(request, 'todo/loginuser.html', {
+                'form': CustomAuthenticationForm(),
+                'error': f'Too many login attempts. Try again in {math.ceil(retry_after / 60)} minute(s).',
+            }, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+
+        # One authenticate() call whether or not the user exists: the model
+        # backend hashes the password either way, so neither the response
+        # nor its timing tells which usernames are taken.
+        form = CustomAuthenticationForm(request, data=request.POST)
+        if not form.is_valid():
+            record_failure()
             return render(request, 'todo/loginuser.html',
                           {'form': CustomAuthenticationForm(), 'error':'Username and password didn\'t match'})
         else:
-            login(request, user)
+            record_success(request, username)
+            login(request, form.get_user())
             return redirect('currenttodos')
 
 
@@ -64,6 +91,20 @@ def logoutuser(request):
         return redirect('home')
 
 
+@login_required
+def deleteaccount(request):
+    """
+    Deactivates the account and logs out at once; the todos are deleted in
+    the background by ``manage.py purgeaccounts``
+    """
+    if request.method == 'GET':
+        return render(request, 'todo/deleteaccount.html')
+
+    schedule_deletion(request.user)
+    logout(request)
+    return redirect('home')
+
+
 @login_required
 def createtodo(request):
     if request.method == 'GET':
@@ -82,38 +123,87 @@ def createtodo(request):
             return render(request, 'todo/createtodo.html', {'form': TodoForm(), 'error': 'Bad data passed in.'})
 
 
+def render_todo_list(request, name, done):
+    """
+    Renders a current/completed list page, reusing the cached list fragment
+    until one of the user's todos changes, or answers 304 when the client's
+    copy is still current.
+    """
+    counters = get_counters(request.user)
+    etag, last_modified = list_validators(request, name, counters)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    def render_fragment():
+        count = counters.completed_count if done else counters.open_count
+        todos = paginate_todos(
+            ToDo.objects.filter(user=request.user, done=done), request, count,
+            archive=ArchivedToDo.objects.filter(user=request.user) if done else None,
+        )
+        html = render_to_string(f'todo/{name}_list.html', {'todos': todos}, request)
+        return str(html), not todos
+
+    # Keyed on the counters read with the rows as well as the version: a
+    # lagging replica's page is cached under its own, older, last_modified.
+    variant = f'{settings.TODO_PAGINATION}:{last_modified.timestamp()}?{request.GET.urlencode()}'
+    html, empty = cached_fragment(request.user.pk, name, variant, render_fragment)
+
+    response = render(request, f'todo/{name}.html', {'todos_html': mark_safe(html), 'todos_empty': empty})
+    return with_validators(request, response, etag, last_modified)
+
+
 @login_required
 def currenttodos(request):
-    todos = ToDo.objects.filter(user=request.user, done=False).order_by('-deadline_datetime')
+    return render_todo_list(request, 'currenttodos', done=False)
 
-    paginator = Paginator(todos, 4)
-    page = request.GET.get("page", 1)
 
+@login_required
+def completedtodos(request):
+    return render_todo_list(request, 'completedtodos', done=True)
+
+
+@login_required
+def searchtodos(request):
+    query = request.GET.get('q', '').strip()
     try:
-        todos = paginator.page(page)
-    except PageNotAnInteger:
-        todos = paginator.page(1)
-    except EmptyPage:
-        todos = paginator.page(paginator.num_pages)
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
 
-    return render(request, 'todo/currenttodos.html', {'todos': todos})
+    todos = search_todos(request.user, query, page) if query else None
 
+    return render(request, 'todo/searchtodos.html', {'todos': todos, 'query': query})
 
-@login_required
-def completedtodos(request):
-    todos = ToDo.objects.filter(user=request.user, done=True).order_by('-deadline_datetime')
 
-    paginator = Paginator(todos, 4)
-    page = request.GET.get("page", 1)
+STATS_DAYS = 30
 
-    try:
-        todos = paginator.page(page)
-    except PageNotAnInteger:
-        todos = paginator.page(1)
-    except EmptyPage:
-        todos = paginator.page(paginator.num_pages)
-        
-    return render(request, 'todo/completedtodos.html', {'todos': todos})
+
+@login_required
+def statstodos(request):
+    """
+    Dashboard of tasks created vs completed per day over the last 30 days,
+    read from the daily rollups
+    """
+    days, totals = dashboard_stats(request.user, days=STATS_DAYS)
+    peak = max([max(day.created, day.completed) for day in days] + [1])
+    chart = [
+        {
+            'day': day.day,
+            'created': day.created,
+            'completed': day.completed,
+            'completed_late': day.completed_late,
+            'created_height': round(day.created * 100 / peak),
+            'completed_height': round(day.completed * 100 / peak),
+        }
+        for day in days
+    ]
+    return render(request, 'todo/statstodos.html', {
+        'chart': chart,
+        'totals': totals,
+        'counters': get_counters(request.user),
+        'days': STATS_DAYS,
+    })
 
 
 @login_required
@@ -123,12 +213,18 @@ def viewtodo(request, todo_pk):
     next_page = request.GET.get("next", "currenttodos")
 
     if request.method == 'GET':
+        etag, last_modified = todo_validators(request, todo_task)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
         form = TodoForm(instance=todo_task)
-        return render(request, 'todo/viewtodo.html', {
+        response = render(request, 'todo/viewtodo.html', {
             'todo_task': todo_task,
             'form': form,
             'next_page': next_page,
         })
+        return with_validators(request, response, etag, last_modified)
     else:
         form = TodoForm(request.POST, instance=todo_task)
 
@@ -161,7 +257,7 @@ def completetodo(request, todo_pk):
         todo.done = True
         todo.save()
 
-        return redirect('currenttodos')
+        return action_response(request, todo.pk, done=True, **({'repeats': True} if todo.recurrence else {}))
 
 
 @login_required
@@ -170,7 +266,7 @@ def deletetodo(request, todo_pk):
     if request.method == 'POST':
         todo.delete()
 
-        return redirect('currenttodos')
+        return action_response(request, todo_pk, deleted=True)
 
 
 @login_required
@@ -178,7 +274,129 @@ def uncompletetodo(request, todo_pk):
     todo = get_object_or_404(ToDo, pk=todo_pk, user=request.user)
     todo.done = False
     todo.save()
-    return redirect('currenttodos')
+    return action_response(request, todo.pk, done=False)
+
+
+@login_required
+def exporttodos(request):
+    """
+    Streams the user's todos, archived ones included, as NDJSON or CSV
+
+    Accepts ``format`` (ndjson or csv) and the optional filters understood by
+    ``todo.exports.parse_filters`` as query parameters.
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Unknown export format.')
+    try:
+        filters = parse_filters(request.GET)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    # Bound to the user's shard now: the rows are read after the middleware
+    # has stopped routing this request there.
+    shard = shard_for(request.user.pk)
+    todos = ToDo.objects.using(shard).filter(user=request.user, **filters)
+    archive = exported_archive(ArchivedToDo.objects.using(shard).filter(user=request.user), filters)
+    response = StreamingHttpResponse(
+        iter_export(todos, export_format, archive), content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="todos.{export_format}"'
+    return response
+
+
+@login_required
+def importtodos(request):
+    if request.method == 'GET':
+        return render(request, 'todo/importtodos.html', {'form': ImportForm()})
+
+    form = ImportForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return render(request, 'todo/importtodos.html', {'form': form})
+
+    upload = form.cleaned_data['file']
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    try:
+        result = import_todos(request.user, read_rows(stream, form.cleaned_data['format']))
+    except UnicodeDecodeError:
+        return render(request, 'todo/importtodos.html', {'form': form, 'error': 'The file must be UTF-8 encoded.'})
+
+    return render(request, 'todo/importtodos.html', {'form': ImportForm(), 'result': result})
+
+
+@login_required
+def synctodos(request):
+    """
+    Returns the user's todo changes since the ``cursor`` query parameter as
+    JSON, at most ``limit`` of them, and the cursor to ask with next (see
+    ``todo.sync.sync_batch``).
+    """
+    try:
+        limit = int(request.GET.get('limit', SYNC_BATCH_SIZE))
+        if limit < 1:
+            raise ValueError(f'Expected a positive limit, got {limit}.')
+        batch = sync_batch(request.user, request.GET.get('cursor', ''), min(limit, SYNC_MAX_BATCH_SIZE))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    return JsonResponse(batch)
+
+
+BULK_ACTIONS = {
+    'complete': lambda todos: todos.filter(done=False).update_tracked(done=True),
+    'uncomplete': lambda todos: todos.filter(done=True).update_tracked(done=False),
+    'important': lambda todos: todos.filter(important=False).update_tracked(important=True),
+    'delete': lambda todos: todos.delete_tracked(),
+}
+
+MAX_BULK_TODOS = 1000
+
+
+@login_required
+@require_POST
+def bulktodos(request):
+    """
+    Applies one action to many of the user's todos with a single UPDATE/DELETE
+
+    Expects POST data with an ``action`` (a key of BULK_ACTIONS) and the
+    selected ``ids`` (at most MAX_BULK_TODOS); ids belonging to other users
+    are silently ignored.
+
+    Returns:
+        JSON ``{"action": ..., "count": ...}`` when asked for JSON,
+        otherwise a redirect back to the ``next`` list page
+    """
+    action = request.POST.get('action')
+    try:
+        ids = [int(pk) for pk in request.POST.getlist('ids')]
+    except ValueError:
+        return HttpResponseBadRequest('Bad ids passed in.')
+    if len(ids) > MAX_BULK_TODOS:
+        return HttpResponseBadRequest(f'Too many ids passed in; at most {MAX_BULK_TODOS} at a time.')
+    if action not in BULK_ACTIONS:
+        return HttpResponseBadRequest('Unknown action.')
+
+    count = BULK_ACTIONS[action](ToDo.objects.filter(user=request.user, pk__in=ids)) if ids else 0
+
+    if request.accepts('application/json') and not request.accepts('text/html'):
+        return JsonResponse({'action': action, 'count': count})
+
+    next_page = request.POST.get('next')
+    if next_page not in ('currenttodos', 'completedtodos'):
+        next_page = 'currenttodos'
+    return redirect(next_page)
+
+
+def metrics(request):
+    """
+    Request and cache metrics in the Prometheus text format
+
+    Open to staff, and to ``Authorization: Bearer <TODO_METRICS_TOKEN>``
+    when that setting is set; everyone else is refused.
+    """
+    token = settings.TODO_METRICS_TOKEN
+    if not (token and request.headers.get('Authorization') == f'Bearer {token}') and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 def custom_404_view(request, exception):
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 import dj_database_url
 from dotenv import load_dotenv
@@ -42,11 +43,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'todo.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'todo.middleware.ReplicaRoutingMiddleware',
+    'todo.middleware.ShardRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,14 +78,127 @@ WSGI_APPLICATION = 'todo_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DB_POOL=True (PostgreSQL only, with psycopg 3 and psycopg-pool) shares a
+# pool of DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections between a process's
+# threads instead of keeping one persistent connection per thread. A request
+# waits up to DB_POOL_TIMEOUT seconds for a free connection; connections are
+# checked before being handed out. manage.py benchpool measures the gain.
+
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True' and os.getenv('DATABASE_URL', '').startswith(('postgres', 'postgis'))
+
 DATABASES = {
     'default': dj_database_url.config(
         default=os.getenv('DATABASE_URL'),
-        conn_max_age=600,
+        # Pooled connections go back to the pool after every request.
+        conn_max_age=0 if DB_POOL else 600,
+        # With a pool, this makes the pool check connections before lending them.
+        conn_health_checks=DB_POOL,
         ssl_require=False
     )
 }
 
+if DB_POOL:
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    }
+
+# Read replicas: DATABASE_REPLICA_URLS is a comma-separated list of database
+# URLs, added as "replica_0", "replica_1", ... todo.routers sends the list and
+# detail pages' reads there, except for users who changed something in the
+# last TODO_REPLICA_STICKY_SECONDS (which should exceed the replication lag).
+# Locally, a second SQLite file migrated with "migrate --database replica_0"
+# stands in for a replica.
+
+TODO_READ_REPLICAS = []
+for url in filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')):
+    alias = f'replica_{len(TODO_READ_REPLICAS)}'
+    DATABASES[alias] = {
+        **dj_database_url.parse(url.strip(), conn_max_age=0 if DB_POOL else 600, conn_health_checks=DB_POOL),
+        # Tests run against the primary only.
+        'TEST': {'MIRROR': 'default'},
+    }
+    if DB_POOL:
+        DATABASES[alias].setdefault('OPTIONS', {})['pool'] = DATABASES['default']['OPTIONS']['pool']
+    TODO_READ_REPLICAS.append(alias)
+
+TODO_REPLICA_STICKY_SECONDS = int(os.getenv('TODO_REPLICA_STICKY_SECONDS', 5))
+
+# User sharding: DATABASE_SHARD_URLS (comma-separated database URLs) adds
+# shards "shard_1", "shard_2", ... next to the default database, shard 0.
+# Each user's todos, archive, counters and stats live on one shard (see
+# todo.sharding); users, sessions and the rest stay on the default database.
+# Migrate every shard ("migrate --database shard_1"). Before changing the
+# list of shards, run "rebalanceshards --pin-all" so nobody's data moves
+# implicitly; then move users with "rebalanceshards <username> --to <shard>".
+
+TODO_SHARDS = ['default']
+for url in filter(None, os.getenv('DATABASE_SHARD_URLS', '').split(',')):
+    alias = f'shard_{len(TODO_SHARDS)}'
+    DATABASES[alias] = {
+        **dj_database_url.parse(url.strip(), conn_max_age=0 if DB_POOL else 600, conn_health_checks=DB_POOL),
+        'TEST': {'MIRROR': 'default'},
+    }
+    if DB_POOL:
+        DATABASES[alias].setdefault('OPTIONS', {})['pool'] = DATABASES['default']['OPTIONS']['pool']
+    TODO_SHARDS.append(alias)
+
+# Without configured shards or replicas, "manage.py test" gets in-memory
+# SQLite stand-ins "shard_1" and "replica_0" (left out of TODO_SHARDS and
+# TODO_READ_REPLICAS) for the tests that need a second database, like
+# moving a user's data or reading from a lagging replica.
+if sys.argv[1:2] == ['test']:
+    for alias in ('shard_1', 'replica_0'):
+        DATABASES.setdefault(alias, {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / f'{alias}.sqlite3'})
+
+DATABASE_ROUTERS = ['todo.sharding.ShardRouter', 'todo.routers.ReplicaRouter']
+
+
+
+# Cache
+# CACHE_BACKEND picks the backend: "locmem", "file" (CACHE_LOCATION is a
+# directory) or "redis" (CACHE_LOCATION is a redis:// URL, needs redis-py).
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': 'todo',
+    'file': str(BASE_DIR / '.cache'),
+    'redis': 'redis://127.0.0.1:6379',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]),
+    }
+}
+
+
+# Sessions and users
+# TODO_SESSION_STORE "cached_db" reads sessions from the cache and writes
+# them through to the database, "cache" keeps them in the cache only, "db"
+# is Django's default. TODO_CACHED_USERS serves request.user from the cache
+# (todo.auth); switching it logs everyone out once, as sessions remember
+# the backend that logged them in.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.getenv('TODO_SESSION_STORE', 'db')]
+
+TODO_CACHED_USERS = os.getenv('TODO_CACHED_USERS', 'False') == 'True'
+TODO_USER_CACHE_TIMEOUT = int(os.getenv('TODO_USER_CACHE_TIMEOUT', 3600))
+AUTHENTICATION_BACKENDS = [
+    'todo.auth.CachedModelBackend' if TODO_CACHED_USERS else 'django.contrib.auth.backends.ModelBackend',
+]
 
 
 # Password validation
@@ -120,6 +237,74 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# TODO_STATIC_PIPELINE: collectstatic writes content-hashed, gzip/brotli
+# precompressed files to STATIC_ROOT, served with far-future cache headers by
+# todo.staticfiles.StaticFilesMiddleware. Run collectstatic before starting
+# the server; templates can't resolve asset URLs without the manifest.
+
+TODO_STATIC_PIPELINE = os.getenv('TODO_STATIC_PIPELINE', 'False') == 'True'
+STATIC_ROOT = os.getenv('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+if TODO_STATIC_PIPELINE:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'todo.staticfiles.CompressedManifestStaticFilesStorage'},
+    }
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'todo.staticfiles.StaticFilesMiddleware')
+
+# Todo lists
+# "cursor" pages by keyset (no COUNT/OFFSET), "offset" uses numbered pages.
+
+TODO_PAGINATION = os.getenv('TODO_PAGINATION', 'cursor')
+
+# Serve the list/detail views with their native async versions (for ASGI).
+TODO_ASYNC_VIEWS = os.getenv('TODO_ASYNC_VIEWS', 'False') == 'True'
+
+# Rendered lists are cached per user until one of their todos changes;
+# a timeout of 0 turns the cache off.
+TODO_CACHE_ALIAS = 'default'
+TODO_CACHE_TIMEOUT = int(os.getenv('TODO_CACHE_TIMEOUT', 300))
+
+# Deadline reminders (manage.py runreminders): todos due within the next
+# TODO_REMINDER_WINDOW minutes are reminded about once, through
+# TODO_REMINDER_BACKEND; workers hold a claimed batch for TODO_REMINDER_LEASE seconds.
+
+TODO_REMINDER_BACKEND = os.getenv('TODO_REMINDER_BACKEND', 'todo.reminders.EmailReminderBackend')
+TODO_REMINDER_WINDOW = int(os.getenv('TODO_REMINDER_WINDOW', 15))
+TODO_REMINDER_GRACE = int(os.getenv('TODO_REMINDER_GRACE', 24 * 60))
+TODO_REMINDER_LEASE = int(os.getenv('TODO_REMINDER_LEASE', 300))
+
+# Request metrics (todo.middleware.InstrumentationMiddleware): requests
+# slower than TODO_SLOW_REQUEST_MS are logged with their SQL (unset: off);
+# /metrics is staff-only, plus "Authorization: Bearer <TODO_METRICS_TOKEN>"
+# when set (for scrapers).
+
+TODO_SLOW_REQUEST_MS = int(os.getenv('TODO_SLOW_REQUEST_MS')) if os.getenv('TODO_SLOW_REQUEST_MS') else None
+TODO_METRICS_TOKEN = os.getenv('TODO_METRICS_TOKEN', '')
+
+# Login throttling: failed or in-flight logins allowed per sliding window, as
+# (attempts, seconds), per username and per client IP. Behind a proxy,
+# TODO_CLIENT_IP_HEADER is the request.META key holding the client address.
+
+TODO_LOGIN_THROTTLE = {
+    'username': (int(os.getenv('TODO_LOGIN_USERNAME_LIMIT', 5)), int(os.getenv('TODO_LOGIN_USERNAME_PERIOD', 15 * 60))),
+    'ip': (int(os.getenv('TODO_LOGIN_IP_LIMIT', 20)), int(os.getenv('TODO_LOGIN_IP_PERIOD', 5 * 60))),
+}
+TODO_CLIENT_IP_HEADER = os.getenv('TODO_CLIENT_IP_HEADER', '')
+
+
+# Email
+# https://docs.djangoproject.com/en/5.2/topics/email/
+
+EMAIL_BACKEND = os.getenv(
+    'EMAIL_BACKEND',
+    'django.core.mail.backends.console.EmailBackend' if DEBUG else 'django.core.mail.backends.smtp.EmailBackend',
+)
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
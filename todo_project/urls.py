@@ -14,27 +14,45 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.conf.urls import handler404, handler500
 from django.contrib import admin
 from django.urls import path
-from todo import views
+from todo import async_views, views
 
-urlpatterns = [
-    path('admin/', admin.site.urls),
-    # Auth
-    path('signup/', views.signupuser, name='signupuser'),
-    path('logout/', views.logoutuser, name='logoutuser'),
-    path('login/', views.loginuser, name='loginuser'),
-    # Todos
-    path('', views.home, name='home'),
-    path('create/', views.createtodo, name='createtodo'),
-    path('current/', views.currenttodos, name='currenttodos'),
-    path('completed/', views.completedtodos, name='completedtodos'),
-    path('todo/<int:todo_pk>', views.viewtodo, name='viewtodo'),
-    path('todo/<int:todo_pk>/complete', views.completetodo, name='completetodo'),
-    path('todo/<int:todo_pk>/delete', views.deletetodo, name='deletetodo'),
-    path('todo/<int:todo_pk>/uncomplete', views.uncompletetodo, name='uncompletetodo')
-]
+
+def build_urlpatterns(list_views):
+    """
+    ``list_views`` provides the list/detail/complete/delete views: todo.views,
+    or todo.async_views for native async handling under ASGI.
+    """
+    return [
+        path('admin/', admin.site.urls),
+        path('metrics', views.metrics, name='metrics'),
+        # Auth
+        path('signup/', views.signupuser, name='signupuser'),
+        path('logout/', views.logoutuser, name='logoutuser'),
+        path('login/', views.loginuser, name='loginuser'),
+        path('account/delete/', views.deleteaccount, name='deleteaccount'),
+        # Todos
+        path('', views.home, name='home'),
+        path('create/', views.createtodo, name='createtodo'),
+        path('current/', list_views.currenttodos, name='currenttodos'),
+        path('completed/', list_views.completedtodos, name='completedtodos'),
+        path('search/', views.searchtodos, name='searchtodos'),
+        path('stats/', views.statstodos, name='statstodos'),
+        path('bulk/', views.bulktodos, name='bulktodos'),
+        path('export/', views.exporttodos, name='exporttodos'),
+        path('import/', views.importtodos, name='importtodos'),
+        path('sync/', views.synctodos, name='synctodos'),
+        path('todo/<int:todo_pk>', list_views.viewtodo, name='viewtodo'),
+        path('todo/<int:todo_pk>/complete', list_views.completetodo, name='completetodo'),
+        path('todo/<int:todo_pk>/delete', list_views.deletetodo, name='deletetodo'),
+        path('todo/<int:todo_pk>/uncomplete', views.uncompletetodo, name='uncompletetodo')
+    ]
+
+
+urlpatterns = build_urlpatterns(async_views if settings.TODO_ASYNC_VIEWS else views)
 
 handler404 = 'todo.views.custom_404_view'
 